@@ -0,0 +1,97 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.encoders import EMBEDDING_DIM
+from src.scoring import SCORE_COLUMNS
+
+""" config """
+STOP_TYPES = ["hub", "residential", "commercial", "welfare", "school", "tourism"]
+# Number of tags drawn for each stop (inclusive range)
+TAGS_PER_STOP = (1, 4)
+# Base tags per topic; embeddings of one topic lie around a common center
+TAGS_PER_TOPIC = 50
+
+
+def base_tag_names(n_tags):
+    return [f"タグ{i}" for i in range(n_tags)]
+
+
+def build_base_tags(path, n_tags, dim=EMBEDDING_DIM, seed=0):
+    """
+    Write a base_tags.csv with `n_tags` random scores and embeddings that
+    cluster by topic, like the embeddings of real tags.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n_tags // TAGS_PER_TOPIC), dim))
+    topics = rng.integers(len(centers), size=n_tags)
+    embeddings = (centers[topics] + 0.6 * rng.standard_normal((n_tags, dim))).astype(np.float32)
+    df = pd.DataFrame({"name": base_tag_names(n_tags)})
+    # Same JSON array strings as the real file
+    df["embedding"] = [json.dumps(row) for row in embeddings.tolist()]
+    for column in SCORE_COLUMNS:
+        df[column] = np.round(rng.uniform(0, 50, n_tags), 2)
+    df["stop_type"] = rng.choice(STOP_TYPES, n_tags)
+    df.to_csv(path, index=False)
+    return path
+
+
+def build_points(path, n_stops, n_base_tags, unknown_ratio=0.3, seed=0):
+    """
+    Write a points file like the API response. Each tag is an unknown tag
+    with probability `unknown_ratio`, otherwise one of the base tags. Unknown
+    tags come from a pool of n_stops / 2 names, so some of them repeat.
+    """
+    rng = np.random.default_rng(seed)
+    names = base_tag_names(n_base_tags)
+    n_unknown = max(1, n_stops // 2)
+    tags = []
+    for _ in range(n_stops):
+        n_tags = rng.integers(TAGS_PER_STOP[0], TAGS_PER_STOP[1] + 1)
+        unknown = rng.random(n_tags) < unknown_ratio
+        tags.append(
+            str(
+                [
+                    f"未知のタグ{rng.integers(n_unknown)}" if is_unknown else names[rng.integers(len(names))]
+                    for is_unknown in unknown
+                ]
+            )
+        )
+    df = pd.DataFrame(
+        {
+            "id": [f"stop-{i}" for i in range(n_stops)],
+            "name": [f"停留所{i}" for i in range(n_stops)],
+            "latitude": np.round(rng.uniform(34.4, 34.6, n_stops), 8),
+            "longitude": np.round(rng.uniform(132.6, 132.9, n_stops), 8),
+            "address": "広島県東広島市",
+            "created_at": "2026-01-01T00:00:00+00:00",
+            "ability": "get_on_off",
+            "type": "traveling",
+            "tags": tags,
+        }
+    )
+    df.to_csv(path, index=False)
+    return path
+
+
+def ensure_dataset(work_dir, n_stops, n_base_tags, unknown_ratio, seed=0):
+    """
+    Build (or reuse) the base tags and points files for these parameters.
+    Returns (base_tags_path, points_path).
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    base_tags_path = os.path.join(work_dir, f"base_tags-{n_base_tags}-{seed}.csv")
+    points_path = os.path.join(
+        work_dir, f"points-{n_stops}-{n_base_tags}-{unknown_ratio}-{seed}.csv"
+    )
+    if not os.path.exists(base_tags_path):
+        print(f"Building {n_base_tags} base tags...")
+        build_base_tags(f"{base_tags_path}.tmp", n_base_tags, seed=seed)
+        os.replace(f"{base_tags_path}.tmp", base_tags_path)
+    if not os.path.exists(points_path):
+        print(f"Building {n_stops} stops...")
+        build_points(f"{points_path}.tmp", n_stops, n_base_tags, unknown_ratio, seed=seed)
+        os.replace(f"{points_path}.tmp", points_path)
+    return base_tags_path, points_path
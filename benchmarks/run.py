@@ -0,0 +1,404 @@
+"""
+Benchmarks for the scoring pipeline and the dummy data generator.
+
+    python -m benchmarks.run                       # small: 1k stops, 100 base tags
+    python -m benchmarks.run --size medium         # 10k stops, 10k base tags
+    python -m benchmarks.run --stops 100000 --base-tags 100000 --unknown-ratio 0.5
+    python -m benchmarks.run --save-baseline       # store the numbers to compare against
+    MOCA_EMBEDDING_DTYPE=int8 python -m benchmarks.run --size medium   # quantized embeddings
+
+Synthetic datasets are built once into --work-dir and reused. Every stage
+runs against files in that directory (never ./data) with the offline
+HashingEncoder. Each stage reports its best wall time over --repeat runs,
+its throughput and its peak traced memory, and is compared with the entry
+for the same parameters in the baseline JSON.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import main
+from benchmarks.datasets import ensure_dataset
+from src import ann, base_tags, data_fetch, dummy, quantize, resolutions, vector
+from src.embedding_cache import EmbeddingCache
+from src.encoders import HashingEncoder
+from src.holiday_calendar import build_calendar
+from src.neighbors import neighbor_features
+from src.parallel import score_points_parallel
+from src.scoring import collect_tags, load_index, parse_tags
+from src.service import ScoringService
+
+""" config """
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+WORK_DIR = os.path.join(BENCHMARK_DIR, ".work")
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+SIZES = {
+    "small": {"stops": 1_000, "base_tags": 100},
+    "medium": {"stops": 10_000, "base_tags": 10_000},
+    "large": {"stops": 100_000, "base_tags": 100_000},
+}
+# A stage is a regression when it is this much slower or larger than the baseline
+TOLERANCE = 0.2
+# ... and the difference is above timer / allocator noise
+NOISE = {"seconds": 0.05, "peak_mb": 1.0}
+# Single-stop requests sent to the scoring service, from this many connections
+SERVICE_REQUESTS = 2000
+SERVICE_CLIENTS = 8
+
+
+class Context:
+    """Paths and parameters shared by the stages of one benchmark run."""
+
+    def __init__(self, work_dir, base_tags_path, points_path, workers):
+        self.run_dir = os.path.join(work_dir, "run")
+        self.base_tags_path = base_tags_path
+        self.points_path = points_path
+        self.workers = workers
+        self.points_df = pd.read_csv(points_path)
+        unique_tags, _, _ = collect_tags(self.points_df["tags"].tolist())
+        self.tags = unique_tags
+        self.n_base_tags = len(pd.read_csv(base_tags_path, usecols=["name"]))
+
+    def isolate(self):
+        # Point every data path of the pipeline at the run directory
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+        os.makedirs(self.run_dir)
+        base_tags.BASE_TAGS_FILE = self.base_tags_path
+        base_tags.BASE_TAGS_EMBEDDINGS_FILE = self.path("base_tags.embeddings.npy")
+        base_tags.BASE_TAGS_META_FILE = self.path("base_tags.meta.csv")
+        base_tags.BASE_TAGS_MANIFEST_FILE = self.path("base_tags.manifest.json")
+        ann.ANN_INDEX_FILE = self.path("base_tags.ivf.npz")
+        resolutions.RESOLUTIONS_FILE = self.path("tag_resolutions.sqlite")
+        data_fetch.CACHE_DATA_FILE = self.path("points_cache.csv")
+        data_fetch.CACHE_META_FILE = self.path("points_cache.meta.json")
+        # A freshly written cache is within its TTL, so the API is never called
+        shutil.copyfile(self.points_path, data_fetch.CACHE_DATA_FILE)
+        main.OUTPUT_FILE = self.path("expanded_points.csv")
+        vector.set_encoder(HashingEncoder())
+        self.reset_embedding_cache()
+
+    def path(self, name):
+        return os.path.join(self.run_dir, name)
+
+    def reset_embedding_cache(self, keep_store=False):
+        vector.embedding_cache.close()
+        store = self.path("embedding_cache.sqlite")
+        if not keep_store:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(store + suffix):
+                    os.remove(store + suffix)
+        vector.embedding_cache = EmbeddingCache(store)
+
+
+# Each stage prepares its inputs and returns (function to time, items processed)
+
+
+def stage_compile_base_tags(ctx):
+    for path in (
+        base_tags.BASE_TAGS_EMBEDDINGS_FILE,
+        base_tags.BASE_TAGS_META_FILE,
+        base_tags.BASE_TAGS_MANIFEST_FILE,
+    ):
+        if os.path.exists(path):
+            os.remove(path)
+    return base_tags.ensure_compiled, ctx.n_base_tags
+
+
+def stage_load_index(ctx):
+    # Compiled (and quantized, for MOCA_EMBEDDING_DTYPE) beforehand
+    base_tags.load_base_tag_embeddings()
+    return load_index, ctx.n_base_tags
+
+
+def stage_encode_cold(ctx):
+    # Every distinct tag of the points, with an empty embedding cache
+    ctx.reset_embedding_cache()
+    return lambda: vector.generate_vectors(ctx.tags), len(ctx.tags)
+
+
+def stage_encode_warm(ctx):
+    # Same tags, read back from the SQLite store by a new process-level cache
+    vector.generate_vectors(ctx.tags)
+    ctx.reset_embedding_cache(keep_store=True)
+    return lambda: vector.generate_vectors(ctx.tags), len(ctx.tags)
+
+
+def stage_score(ctx):
+    # Scoring only: index loaded and unknown tags already in the cache, every
+    # unknown tag goes through the similarity search
+    index = load_index()
+    index.resolutions = None
+    vector.generate_vectors(ctx.tags)
+    return lambda: score_points_parallel(ctx.points_df, index, ctx.workers), len(ctx.points_df)
+
+
+def stage_build_ann(ctx):
+    # IVF index build including the nprobe / recall@5 tuning
+    index = load_index()
+    if os.path.exists(ann.ANN_INDEX_FILE):
+        os.remove(ann.ANN_INDEX_FILE)
+    return lambda: ann.load_ann_index(index.embeddings, index.norms), ctx.n_base_tags
+
+
+def stage_score_ann(ctx):
+    # Like score, with the approximate search (exact below ann.ANN_MIN_ROWS)
+    index = load_index(ann=True)
+    index.resolutions = None
+    vector.generate_vectors(ctx.tags)
+    return lambda: score_points_parallel(ctx.points_df, index, ctx.workers), len(ctx.points_df)
+
+
+def stage_score_resolved(ctx):
+    # Like score, with every unknown tag already in the resolution table
+    index = load_index()
+    score_points_parallel(ctx.points_df, index, ctx.workers)
+    return lambda: score_points_parallel(ctx.points_df, index, ctx.workers), len(ctx.points_df)
+
+
+def stage_neighbors(ctx):
+    # Neighborhood features of the scored stops within the default radius
+    scores_df = score_points_parallel(ctx.points_df, load_index(), ctx.workers)
+    points_df = pd.concat([ctx.points_df, scores_df], axis=1)
+    return lambda: neighbor_features(points_df), len(points_df)
+
+
+def stage_main(ctx):
+    # End to end: load the cached points, build the index, score, write the output
+    base_tags.ensure_compiled()
+    vector.generate_vectors(ctx.tags)
+    return lambda: main.main(["--workers", str(ctx.workers)]), len(ctx.points_df)
+
+
+async def _post(reader, writer, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write(f"POST /score HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = await reader.readline()
+    length = 0
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    body = await reader.readexactly(length)
+    if b" 200 " not in status:
+        raise Exception(f"Scoring service answered {status.decode().strip()}: {body.decode()}")
+    return json.loads(body)
+
+
+async def _service_session(ctx):
+    """
+    Start the service, score the first SERVICE_REQUESTS stops in one request,
+    then request each of them again alone from SERVICE_CLIENTS connections.
+    Returns the latencies of the repeated requests.
+    """
+    service = ScoringService()
+    ready = asyncio.get_running_loop().create_future()
+    server = asyncio.create_task(service.serve("127.0.0.1", 0, ready.set_result))
+    port = await ready
+    tag_lists = [parse_tags(value) for value in ctx.points_df["tags"][:SERVICE_REQUESTS]]
+    latencies = []
+
+    async def client(lists):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            for tags in lists:
+                start = time.perf_counter()
+                await _post(reader, writer, {"tags": tags})
+                latencies.append(time.perf_counter() - start)
+        finally:
+            writer.close()
+
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await _post(reader, writer, {"stops": [{"tags": tags} for tags in tag_lists]})
+        writer.close()
+        await asyncio.gather(*[client(tag_lists[i::SERVICE_CLIENTS]) for i in range(SERVICE_CLIENTS)])
+    finally:
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+    return latencies
+
+
+def stage_service(ctx):
+    # Scoring service from start-up; reports the p99 latency of already-seen tag lists
+    base_tags.ensure_compiled()
+    vector.generate_vectors(ctx.tags)
+
+    def run():
+        # The service opens the SQLite store on its own thread
+        vector.embedding_cache.close()
+        latencies = asyncio.run(_service_session(ctx))
+        return {"p99_ms": float(np.percentile(latencies, 99)) * 1000}
+
+    return run, min(SERVICE_REQUESTS, len(ctx.points_df))
+
+
+def stage_dummy(ctx):
+    days = len(build_calendar(dummy.START_DATE, dummy.END_DATE))
+    run = lambda: dummy.generate_dataset(rng=np.random.default_rng(dummy.SEED))
+    return run, days * len(dummy.TIME_SLOTS)
+
+
+STAGES = {
+    "compile_base_tags": stage_compile_base_tags,
+    "load_index": stage_load_index,
+    "encode_cold": stage_encode_cold,
+    "encode_warm": stage_encode_warm,
+    "score": stage_score,
+    "build_ann": stage_build_ann,
+    "score_ann": stage_score_ann,
+    "score_resolved": stage_score_resolved,
+    "neighbors": stage_neighbors,
+    "main": stage_main,
+    "service": stage_service,
+    "dummy": stage_dummy,
+}
+
+
+def _quiet(run):
+    # The pipeline prints progress; keep the benchmark table readable
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        return run()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def measure(stage, ctx, repeat, memory=True):
+    times = []
+    for _ in range(repeat):
+        run, items = _quiet(lambda: stage(ctx))
+        start = time.perf_counter()
+        extra = _quiet(run)
+        times.append(time.perf_counter() - start)
+        # A stage may return extra measurements (e.g. latency); keep the best run's
+        if times[-1] == min(times):
+            extras = extra if isinstance(extra, dict) else {}
+    seconds = min(times)
+    result = {"seconds": seconds, "items": items, "items_per_s": items / seconds if seconds else None}
+    result.update(extras)
+    if memory:
+        # Separate run, since tracing slows the stage down
+        run, _ = _quiet(lambda: stage(ctx))
+        tracemalloc.start()
+        try:
+            _quiet(run)
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Print every stage next to its baseline; returns the regressed stage names."""
+    regressions = []
+    print(f"\n{'stage':<18} {'seconds':>9} {'base':>9} {'ratio':>6} {'items/s':>11} {'peak MB':>8} {'base':>8}")
+    for name, result in results["stages"].items():
+        base = (baseline or {}).get("stages", {}).get(name, {})
+        regressed = False
+        for metric, noise in NOISE.items():
+            if result.get(metric) is not None and base.get(metric):
+                regressed |= (
+                    result[metric] > base[metric] * (1 + tolerance)
+                    and result[metric] - base[metric] > noise
+                )
+        if regressed:
+            regressions.append(name)
+        fmt = lambda value, spec: format(value, spec) if value is not None else "-"
+        print(
+            f"{name:<18} {result['seconds']:>9.3f} {fmt(base.get('seconds'), '9.3f'):>9} "
+            f"{fmt(result['seconds'] / base['seconds'] if base.get('seconds') else None, '6.2f'):>6} "
+            f"{fmt(result['items_per_s'], '11.0f'):>11} {fmt(result.get('peak_mb'), '8.1f'):>8} "
+            f"{fmt(base.get('peak_mb'), '8.1f'):>8}"
+            + (f"  p99 {result['p99_ms']:.2f} ms" if "p99_ms" in result else "")
+            + ("  REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+def baseline_key(config):
+    key = ",".join(f"{key}={config[key]}" for key in ("stops", "base_tags", "unknown_ratio", "workers"))
+    # float32 keeps the keys of baselines saved before quantized storage existed
+    if config["dtype"] != "float32":
+        key += f",dtype={config['dtype']}"
+    return key
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark scoring, loading and generation.")
+    parser.add_argument("--size", choices=SIZES, default="small", help="dataset preset (default: small)")
+    parser.add_argument("--stops", type=int, help="number of stops (overrides --size)")
+    parser.add_argument("--base-tags", type=int, help="number of base tags (overrides --size)")
+    parser.add_argument("--unknown-ratio", type=float, default=0.3, help="share of tags not in the base tags")
+    parser.add_argument("--workers", type=int, default=1, help="processes used by the scoring stages")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="stages to run")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced peak memory run")
+    parser.add_argument("--work-dir", default=WORK_DIR, help="where datasets are built and runs happen")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown (default: 0.2)")
+    args = parser.parse_args(argv)
+    if not 0 <= args.unknown_ratio <= 1:
+        parser.error("--unknown-ratio must be between 0 and 1")
+    return args
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    config = {
+        "stops": args.stops or SIZES[args.size]["stops"],
+        "base_tags": args.base_tags or SIZES[args.size]["base_tags"],
+        "unknown_ratio": args.unknown_ratio,
+        "workers": args.workers,
+        "dtype": quantize.EMBEDDING_DTYPE,
+    }
+    base_tags_path, points_path = ensure_dataset(
+        args.work_dir, config["stops"], config["base_tags"], config["unknown_ratio"]
+    )
+    ctx = Context(args.work_dir, base_tags_path, points_path, args.workers)
+    ctx.isolate()
+
+    results = {"config": config, "stages": {}}
+    for name in args.stages:
+        print(f"Running {name}...")
+        results["stages"][name] = measure(STAGES[name], ctx, args.repeat, memory=not args.no_memory)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    key = baseline_key(config)
+    regressions = compare(results, baselines.get(key), args.tolerance)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        baselines[key] = results
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"Saved baseline for {key} to {args.baseline}")
+    elif regressions:
+        print(f"\nSlower or larger than the baseline: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
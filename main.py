@@ -1,125 +1,190 @@
+import argparse
+import os
+
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from collections import Counter
 
+from src import vector
+from src.ann import ann_in_use
 from src.base_tags import load_base_tags
-from src.data_fetch import load_data
-from src.vector import generate_vector
-import ast
+from src.columnar import with_extension, write_table
+from src.data_fetch import fetch_data, load_data
+from src.incremental import clear_fingerprints, incremental_scores, save_fingerprints
+from src.metrics import cprofile_to, metrics
+from src.neighbors import NEIGHBOR_RADIUS_KM, neighbor_features
+from src.parallel import score_points_parallel
+from src.scoring import load_index
+from src.streaming import stream_scores
+
+""" config """
+OUTPUT_FILE = "./data/expanded_points.csv"
+# Stages of a run that --profile can attach cProfile to
+PROFILE_STAGES = (
+    "fetch",
+    "load_points",
+    "load_index",
+    "encode",
+    "similarity",
+    "score",
+    "neighbors",
+    "write",
+    "total",
+)
+
+
+def metrics_path(output_file):
+    # Stage timings and counters of the last run, next to the output
+    return f"{os.path.splitext(output_file)[0]}.metrics.json"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Expand the stop tags into feature scores.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="rescore only new or changed stops and reuse the previous output for the rest",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        help="stream the points file in chunks of this many rows (resumable)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="ask the API for new stop data even if the cache is still fresh",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes used to score the stops (default: 1)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("csv", "parquet", "feather"),
+        default="csv",
+        help="file format of the points input and the output (default: csv)",
+    )
+    parser.add_argument(
+        "--ann",
+        action="store_true",
+        help="search similar base tags with the approximate IVF index (large vocabularies)",
+    )
+    parser.add_argument(
+        "--neighbors",
+        action="store_true",
+        help="add features of the nearby stops (scores, counts by stop_type)",
+    )
+    parser.add_argument(
+        "--radius-km",
+        type=float,
+        default=NEIGHBOR_RADIUS_KM,
+        help=f"distance within which stops are neighbors (default: {NEIGHBOR_RADIUS_KM})",
+    )
+    parser.add_argument(
+        "--summary",
+        action="store_true",
+        help="print the stage timings and counters at the end of the run",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="STAGE",
+        choices=PROFILE_STAGES,
+        help="profile one stage (e.g. score, encode, similarity) with cProfile",
+    )
+    args = parser.parse_args(argv)
+    if args.incremental and args.chunk_size:
+        parser.error("--incremental cannot be combined with --chunk-size")
+    if args.chunk_size and args.format != "csv":
+        parser.error("--chunk-size only supports --format csv")
+    if args.neighbors and args.chunk_size:
+        parser.error("--neighbors needs all stops at once and cannot be combined with --chunk-size")
+    if args.radius_km <= 0:
+        parser.error("--radius-km must be positive")
+    return args
+
+
+def run(args):
+    """Run the pipeline for the parsed `args`; returns the output file."""
+    if args.refresh:
+        with metrics.stage("fetch"):
+            fetch_data(force=True)
 
+    if args.chunk_size:
+        # Score and append one chunk at a time with bounded memory
+        stream_scores(load_index(args.ann), OUTPUT_FILE, args.chunk_size, args.workers)
+        return OUTPUT_FILE
+
+    output_file = with_extension(OUTPUT_FILE, args.format)
 
-def main():
     # Load the main data points
-    points_df = load_data()
-    # Load the base tags and their associated scores/embeddings
-    base_tags_df = load_base_tags()
-
-    # Store the calculated scores for each row
-    scores_list = []
-
-    # Iterate over each data point
-    for _, row in points_df.iterrows():
-        tags = ast.literal_eval(row["tags"])
-        # Initialize score dictionary for each category
-        scores = {
-            "education_score": 0,
-            "tourism_score": 0,
-            "welfare_score": 0,
-            "terrain_score": 0,
-            "transport_score": 0,
-            "residential_score": 0,
-            "commercial_score": 0,
-            "base_demand_score": 0,
-            "morning_peak_factor": 0,
-            "evening_peak_factor": 0,
-            "daytime_factor": 0,
-            "weekend_factor": 0,
-            "weather_sensitivity": 0,
-            "seasonal_variation": 0,
-            "stop_type": "",
-        }
-
-        # Store hit_tags for this data point
-        hit_tags = []
-
-        # Process each tag for the current data point
-        for tag in tags:
-            # If the tag is found in the base tags, add its scores directly
-            if tag in base_tags_df["name"].values:
-                for key in scores.keys():
-                    if key != "stop_type":  # Skip non-numeric columns
-                        scores[key] += base_tags_df.loc[
-                            base_tags_df["name"] == tag, key
-                        ].values[0]
-                    else:
-                        hit_tags.append(base_tags_df.loc[
-                            base_tags_df["name"] == tag, key
-                        ].values[0])
-            else:
-                # If the tag is not found, generate its vector and find the 5 most similar base tags
-                tag_vector = generate_vector(tag)
-                similarities = base_tags_df["embedding"].apply(
-                    lambda x: cosine_similarity(tag_vector.reshape(1, -1), x.reshape(1, -1))[0][0]
-                )
-                best_5_indices = similarities.nlargest(5).index
-                best_5_tags = base_tags_df.loc[best_5_indices]
-                best_5_similarities = similarities.loc[best_5_indices]
-                
-                # Sort by similarity in descending order to maintain ranking
-                similarity_sort_order = best_5_similarities.sort_values(ascending=False).index
-                best_5_tags = best_5_tags.loc[similarity_sort_order]
-                best_5_similarities = best_5_similarities.loc[similarity_sort_order]
-                similarity_sum = best_5_similarities.sum()
-
-                # Update hit_tags
-                hit_tags.append(best_5_tags["stop_type"].values[0])
-
-                # Check the its validation
-                # print(f"Tag {tag} is similar to {best_5_tags["name"].values}")
-                
-                # Assign stop_type from the most similar tag
-                most_similar_idx = best_5_similarities.idxmax()
-                scores["stop_type"] = base_tags_df.loc[most_similar_idx, "stop_type"]
-                
-                # Weighted sum of the top 5 similar tags' scores
-                for _, best_row in best_5_tags.iterrows():
-                    similarity = best_5_similarities[best_row.name]
-                    weight = similarity / similarity_sum
-                    for key in scores.keys():
-                        if key != "stop_type":  # Skip non-numeric columns
-                            scores[key] += best_row[key] * weight
-            
-        # Find the most common stop_type in hit_tags
-        if hit_tags:
-            # Flatten the hit_tags list (it may contain arrays) and convert to strings
-            flattened_tags = []
-            for tag in hit_tags:
-                if isinstance(tag, (list, tuple)):
-                    flattened_tags.extend([str(t) for t in tag])
-                else:
-                    flattened_tags.append(str(tag))
-            
-            # Get the most common stop_type
-            if flattened_tags:
-                counter = Counter(flattened_tags)
-                most_common_stop_type = counter.most_common(1)[0][0]
-                scores["stop_type"] = most_common_stop_type
-        
-        # Average the scores by the number of tags
-        tags_amount = len(tags)
-        for key in scores.keys():
-            if key != "stop_type":  # Skip non-numeric columns
-                scores[key] = scores[key] / tags_amount
-        
-        # Store the scores for this row
-        scores_list.append(scores)
-    
-    # Convert the scores list to a DataFrame and add them as new columns
-    scores_df = pd.DataFrame(scores_list)
+    with metrics.stage("load_points"):
+        points_df = load_data(args.format)
+
+    with metrics.stage("score"):
+        if args.incremental:
+            scores_df, fingerprints = incremental_scores(
+                points_df,
+                lambda: load_index(args.ann),
+                output_file,
+                args.workers,
+                ann_in_use(args.ann),
+            )
+        else:
+            # Calculate the scores of every data point in one pass
+            scores_df = score_points_parallel(points_df, load_index(args.ann), args.workers)
+
+    # Add the scores as new columns
     points_df = pd.concat([points_df, scores_df], axis=1)
-    
+
+    if args.neighbors:
+        # Depends on every stop around, so it is recomputed even in incremental runs
+        with metrics.stage("neighbors"):
+            stop_types = sorted(load_base_tags()["stop_type"].dropna().astype(str).unique())
+            points_df = pd.concat(
+                [points_df, neighbor_features(points_df, args.radius_km, stop_types)], axis=1
+            )
+
     # Display the updated DataFrame
-    points_df.to_csv("./data/expanded_points.csv", index=False)
+    with metrics.stage("write"):
+        write_table(points_df, output_file)
+        if args.incremental:
+            save_fingerprints(points_df, fingerprints, output_file)
+        else:
+            clear_fingerprints(output_file)
+    metrics.count("rows_written", len(points_df))
+    return output_file
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.reset()
+    output_file = with_extension(OUTPUT_FILE, args.format)
+    if args.profile:
+        profile_file = f"{os.path.splitext(output_file)[0]}.{args.profile}.prof"
+        # So a profile left by an earlier run is not mistaken for this one
+        if os.path.exists(profile_file):
+            os.remove(profile_file)
+        metrics.set_profiler(args.profile, cprofile_to(profile_file))
+
+    cache = vector.embedding_cache
+    cache_hits, cache_misses = cache.hits, cache.misses
+    try:
+        with metrics.stage("total"):
+            output_file = run(args)
+    finally:
+        # Written even when the run fails, to see how far it got
+        metrics.count("embedding_cache_hits", cache.hits - cache_hits)
+        metrics.count("embedding_cache_misses", cache.misses - cache_misses)
+        metrics.write(metrics_path(output_file))
+        if args.summary:
+            print(metrics.summary())
+    if args.profile:
+        # A stage that did not run this time (e.g. fetch without --refresh) leaves no profile
+        if os.path.exists(profile_file):
+            print(f"Profile of {args.profile} written to {profile_file}")
+        else:
+            print(f"Stage {args.profile} did not run, no profile written")
 
 
 if __name__ == "__main__":
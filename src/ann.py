@@ -0,0 +1,232 @@
+import math
+import os
+
+import numpy as np
+
+from src.base_tags import DATA_DIR, _write_atomic, base_tags_version, ensure_compiled
+from src.quantize import QuantizedMatrix
+from src.similarity import normalize_rows, sample_queries, top_k_similar
+
+""" config """
+# Inverted-file index over the base tag embeddings, rebuilt when base_tags.csv changes
+ANN_INDEX_FILE = os.path.join(DATA_DIR, "base_tags.ivf.npz")
+# Smaller vocabularies are searched exactly, a full scan is cheap there
+ANN_MIN_ROWS = 2000
+# Number of lists = LISTS_PER_SQRT * sqrt(rows), so a probe touches O(sqrt(rows)) rows
+LISTS_PER_SQRT = 2
+KMEANS_ITERATIONS = 10
+# k-means is trained on at most this many rows per list
+TRAIN_ROWS_PER_LIST = 64
+# nprobe is doubled at build time until recall@5 on the check queries reaches this
+TARGET_RECALL = 0.95
+RECALL_QUERIES = 500
+# Check queries are base tags moved by a random vector of this length
+RECALL_NOISE = 0.5
+ASSIGN_BATCH_SIZE = 4096
+SEED = 0
+
+
+def _unit_rows(embeddings, norms):
+    return (np.asarray(embeddings[:], dtype=np.float32) / norms[:, None]).astype(np.float32)
+
+
+def _storage_dtype(embeddings):
+    # The lists hold rows read back from this storage type, so it is part of the key
+    if isinstance(embeddings, QuantizedMatrix):
+        return str(embeddings.data.dtype)
+    return str(np.dtype(embeddings.dtype))
+
+
+def _assign(vectors, centroids):
+    # Closest centroid (largest dot product) of each unit vector
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BATCH_SIZE):
+        stop = start + ASSIGN_BATCH_SIZE
+        assign[start:stop] = np.argmax(vectors[start:stop] @ centroids.T, axis=1)
+    return assign
+
+
+class IVFIndex:
+    """
+    Inverted-file index: the base rows are clustered by spherical k-means and
+    a query only scans the rows of its `nprobe` closest clusters. Each list's
+    unit vectors are stored contiguously, so a probe reads one slice. As in
+    top_k_similar the scan runs in float32 and the k winners are rescored in
+    float64 against the base matrix.
+    """
+
+    def __init__(self, centroids, order, offsets, vectors, nprobe=1, recall=None):
+        self.centroids = centroids
+        # Row numbers grouped by list; list i is order[offsets[i]:offsets[i + 1]]
+        self.order = order
+        self.offsets = offsets
+        # Unit float32 base rows in the same order as `order`
+        self.vectors = vectors
+        self.nprobe = nprobe
+        self.recall = recall
+        # File the index was saved to or read from, so workers can read it themselves
+        self.path = None
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def search(self, queries, base, base_norms, k=5, nprobe=None):
+        """Same contract as similarity.top_k_similar, over the probed lists only."""
+        queries = normalize_rows(np.atleast_2d(queries))
+        k = min(k, len(base_norms))
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        sizes = np.diff(self.offsets)
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        similarities = np.empty((len(queries), k), dtype=np.float64)
+        for start in range(0, len(queries), ASSIGN_BATCH_SIZE):
+            batch = queries[start : start + ASSIGN_BATCH_SIZE]
+            probes = np.argsort(-(batch.astype(np.float32) @ self.centroids.T), axis=1)
+            for i, (query, lists) in enumerate(zip(batch, probes)):
+                # At least nprobe lists, and enough of them to hold k rows
+                n = max(nprobe, int(np.searchsorted(np.cumsum(sizes[lists]), k)) + 1)
+                slices = [slice(self.offsets[l], self.offsets[l + 1]) for l in lists[:n]]
+                positions = np.concatenate([np.arange(s.start, s.stop) for s in slices])
+                sims = np.concatenate([self.vectors[s] for s in slices]) @ query.astype(np.float32)
+                winners = self.order[positions[np.argpartition(-sims, k - 1)[:k]]]
+                rows = np.asarray(base[winners], dtype=np.float64)
+                rows /= base_norms[winners][:, None]
+                # Same einsum as top_k_similar, so equal rows give bit-equal scores
+                exact = np.einsum("nkd,nd->nk", rows[None], query[None])[0]
+                # Ties keep the lower row first, like top_k_similar
+                best = np.lexsort((winners, -exact))
+                indices[start + i] = winners[best]
+                similarities[start + i] = exact[best]
+        return indices, similarities
+
+    def measure_recall(self, base, base_norms, k=5, nprobe=None, n_queries=RECALL_QUERIES, seed=SEED):
+        """Mean share of the exact top k that the index returns, on perturbed base rows."""
+        queries = sample_queries(base, base_norms, n_queries, RECALL_NOISE, seed)
+        exact, _ = top_k_similar(queries, base, base_norms, k)
+        approx, _ = self.search(queries, base, base_norms, k, nprobe)
+        found = [len(np.intersect1d(a, e)) for a, e in zip(approx, exact)]
+        return float(np.mean(found)) / exact.shape[1]
+
+    def tune(self, base, base_norms, target=TARGET_RECALL):
+        # Smallest power-of-two nprobe that reaches the target recall@5
+        self.nprobe = 1
+        while True:
+            self.recall = self.measure_recall(base, base_norms)
+            if self.recall >= target or self.nprobe >= self.nlist:
+                return self
+            self.nprobe = min(self.nprobe * 2, self.nlist)
+
+
+def build_ivf(embeddings, norms, nlist=None, seed=SEED):
+    """Cluster the base rows into `nlist` lists (default LISTS_PER_SQRT * sqrt(rows))."""
+    rng = np.random.default_rng(seed)
+    n_rows = len(norms)
+    nlist = min(n_rows, nlist or max(1, round(LISTS_PER_SQRT * math.sqrt(n_rows))))
+    vectors = _unit_rows(embeddings, norms)
+
+    train = vectors[np.sort(rng.choice(n_rows, min(n_rows, nlist * TRAIN_ROWS_PER_LIST), replace=False))]
+    centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = _assign(train, centroids)
+        counts = np.bincount(assign, minlength=nlist)
+        grouped = np.argsort(assign, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        centroids[filled] = np.add.reduceat(train[grouped], starts[filled], axis=0)
+        # Empty lists restart from a random training row
+        centroids[~filled] = train[rng.choice(len(train), int((~filled).sum()))]
+        centroids = normalize_rows(centroids).astype(np.float32)
+
+    assign = _assign(vectors, centroids)
+    order = np.argsort(assign, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+    return IVFIndex(centroids, order, offsets, vectors[order])
+
+
+def ivf_files(path):
+    # The row order and unit vectors are saved next to `path` as .npy files,
+    # so they can be memory-mapped (and shared by worker processes)
+    root, _ = os.path.splitext(path)
+    return f"{root}.order.npy", f"{root}.vectors.npy"
+
+
+def _save(ivf, version, n_rows, dtype):
+    order_file, vectors_file = ivf_files(ANN_INDEX_FILE)
+    _write_atomic(order_file, lambda f: np.save(f, ivf.order), mode="wb")
+    _write_atomic(vectors_file, lambda f: np.save(f, ivf.vectors), mode="wb")
+
+    # Written last, so the key only matches once the .npy files are complete
+    def write(f):
+        np.savez(
+            f,
+            centroids=ivf.centroids,
+            offsets=ivf.offsets,
+            nprobe=ivf.nprobe,
+            recall=ivf.recall,
+            csv_sha256=version,
+            rows=n_rows,
+            dtype=dtype,
+        )
+
+    _write_atomic(ANN_INDEX_FILE, write, mode="wb")
+
+
+def read_ivf(path):
+    """
+    The IVF index saved at `path`, without checking which base tags it was
+    built from. The row order and vectors are memory-mapped, not read.
+    """
+    order_file, vectors_file = ivf_files(path)
+    with np.load(path) as data:
+        ivf = IVFIndex(
+            data["centroids"],
+            np.load(order_file, mmap_mode="r"),
+            data["offsets"],
+            np.load(vectors_file, mmap_mode="r"),
+            nprobe=int(data["nprobe"]),
+            recall=float(data["recall"]),
+        )
+    ivf.path = path
+    return ivf
+
+
+def _load(version, n_rows, dtype):
+    if not all(os.path.exists(p) for p in (ANN_INDEX_FILE, *ivf_files(ANN_INDEX_FILE))):
+        return None
+    with np.load(ANN_INDEX_FILE) as data:
+        if str(data["csv_sha256"]) != version or int(data["rows"]) != n_rows:
+            return None
+        if "dtype" not in data or str(data["dtype"]) != dtype:
+            return None
+    return read_ivf(ANN_INDEX_FILE)
+
+
+def ann_in_use(ann):
+    """
+    Whether asking for the approximate search (--ann) changes the search:
+    the same answer as `load_ann_index(...) is not None`, without loading
+    the embeddings. Smaller vocabularies are searched exactly either way.
+    """
+    return bool(ann) and ensure_compiled()["rows"] >= ANN_MIN_ROWS
+
+
+def load_ann_index(embeddings, norms):
+    """
+    The IVF index of the current base tags, built and saved next to
+    base_tags.csv on first use and whenever the CSV or the embedding dtype
+    changes. Returns None
+    for vocabularies below ANN_MIN_ROWS, which are searched exactly.
+    """
+    n_rows = len(norms)
+    if n_rows < ANN_MIN_ROWS:
+        return None
+    version = base_tags_version()
+    dtype = _storage_dtype(embeddings)
+    ivf = _load(version, n_rows, dtype)
+    if ivf is None:
+        print("Building ANN index...")
+        ivf = build_ivf(embeddings, norms).tune(embeddings, norms)
+        _save(ivf, version, n_rows, dtype)
+        ivf.path = ANN_INDEX_FILE
+        print(f"ANN index: {ivf.nlist} lists, nprobe {ivf.nprobe}, recall@5 {ivf.recall:.3f}")
+    return ivf
@@ -1,19 +1,170 @@
+import hashlib
+import json
 import os
 
 import numpy as np
 import pandas as pd
 
+from src.quantize import EMBEDDING_DTYPE, QuantizedMatrix, check_dtype, check_quantization, quantize
+from src.scoring import SCORE_COLUMNS
+from src.similarity import row_norms, sample_queries
+
 """ config """
 DATA_DIR = os.path.join(os.path.dirname(__file__), "../data")
 BASE_TAGS_FILE = os.path.join(DATA_DIR, "base_tags.csv")
+# Compiled sidecars, rebuilt automatically when base_tags.csv changes
+BASE_TAGS_EMBEDDINGS_FILE = os.path.join(DATA_DIR, "base_tags.embeddings.npy")
+BASE_TAGS_META_FILE = os.path.join(DATA_DIR, "base_tags.meta.csv")
+BASE_TAGS_MANIFEST_FILE = os.path.join(DATA_DIR, "base_tags.manifest.json")
+# Queries used to check a quantized copy against float32 (base tags moved by this much)
+QUANTIZATION_CHECK_QUERIES = 500
+QUANTIZATION_CHECK_NOISE = 0.5
 
 
-def load_base_tags():
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_manifest():
+    if not os.path.exists(BASE_TAGS_MANIFEST_FILE):
+        return None
+    with open(BASE_TAGS_MANIFEST_FILE) as f:
+        return json.load(f)
+
+
+def _write_atomic(path, write, mode="w"):
+    # Write to a temporary file first so readers never see a partial file
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def compile_base_tags():
+    """
+    Compile base_tags.csv into a float32 embedding matrix (.npy) and a
+    metadata table holding every other column plus the embedding norms.
+    The manifest is written last and records the CSV hash.
+    """
     if not os.path.exists(BASE_TAGS_FILE):
         raise Exception(f"Base tags file not found: {BASE_TAGS_FILE}")
+    stat = os.stat(BASE_TAGS_FILE)
+    csv_hash = file_hash(BASE_TAGS_FILE)
     df = pd.read_csv(BASE_TAGS_FILE)
-    # Convert embedding column from string to numpy array
-    df["embedding"] = df["embedding"].apply(
-        lambda x: np.array(eval(x)) if isinstance(x, str) else x
+    # The embedding strings are JSON arrays, so there is no need for eval().
+    # They hold float32 model outputs, so float32 storage is lossless.
+    embeddings = np.array([json.loads(x) for x in df["embedding"]], dtype=np.float32)
+    meta_df = df.drop(columns=["embedding"])
+    meta_df["embedding_norm"] = row_norms(embeddings)
+
+    _write_atomic(BASE_TAGS_EMBEDDINGS_FILE, lambda f: np.save(f, embeddings), mode="wb")
+    _write_atomic(BASE_TAGS_META_FILE, lambda f: meta_df.to_csv(f, index=False))
+    manifest = {
+        "csv_sha256": csv_hash,
+        "csv_size": stat.st_size,
+        "csv_mtime_ns": stat.st_mtime_ns,
+        "rows": len(df),
+        "dim": embeddings.shape[1],
+    }
+    _write_atomic(BASE_TAGS_MANIFEST_FILE, lambda f: json.dump(manifest, f, indent=2))
+    return manifest
+
+
+def ensure_compiled():
+    """Return the manifest, recompiling the sidecars if base_tags.csv changed."""
+    if not os.path.exists(BASE_TAGS_FILE):
+        raise Exception(f"Base tags file not found: {BASE_TAGS_FILE}")
+    manifest = _read_manifest()
+    if manifest is not None and all(
+        os.path.exists(p) for p in (BASE_TAGS_EMBEDDINGS_FILE, BASE_TAGS_META_FILE)
+    ):
+        stat = os.stat(BASE_TAGS_FILE)
+        # Size and mtime unchanged: skip hashing the CSV
+        if (stat.st_size, stat.st_mtime_ns) == (manifest["csv_size"], manifest["csv_mtime_ns"]):
+            return manifest
+        if file_hash(BASE_TAGS_FILE) == manifest["csv_sha256"]:
+            # Same content, only touched: remember the new stat
+            manifest.update(csv_size=stat.st_size, csv_mtime_ns=stat.st_mtime_ns)
+            _write_atomic(BASE_TAGS_MANIFEST_FILE, lambda f: json.dump(manifest, f, indent=2))
+            return manifest
+    print("Compiling base tags...")
+    return compile_base_tags()
+
+
+def quantized_files(dtype):
+    # Quantized values, and the per-row scales and norms, next to the float32 matrix
+    root, _ = os.path.splitext(BASE_TAGS_EMBEDDINGS_FILE)
+    return f"{root}.{dtype}.npy", f"{root}.{dtype}.rows.npz"
+
+
+def compile_quantized(dtype, manifest):
+    """
+    Write the `dtype` copy of the compiled embeddings and check its top-5
+    neighbors and weighted scores against float32. The check result is kept
+    in the manifest, so it only runs again when base_tags.csv changes.
+    """
+    embeddings = np.load(BASE_TAGS_EMBEDDINGS_FILE, mmap_mode="r")
+    meta_df = pd.read_csv(BASE_TAGS_META_FILE)
+    norms = meta_df["embedding_norm"].to_numpy(dtype=np.float64)
+    data, scales = quantize(embeddings, dtype)
+    quantized = QuantizedMatrix(data, scales)
+    queries = sample_queries(embeddings, norms, QUANTIZATION_CHECK_QUERIES, QUANTIZATION_CHECK_NOISE)
+    scores = meta_df[SCORE_COLUMNS].to_numpy(dtype=np.float64)
+    check = check_quantization(embeddings, norms, quantized, scores, dtype, queries)
+
+    data_file, rows_file = quantized_files(dtype)
+    _write_atomic(data_file, lambda f: np.save(f, data), mode="wb")
+    _write_atomic(
+        rows_file,
+        lambda f: np.savez(
+            f, scales=scales if scales is not None else np.empty(0), norms=quantized.norms
+        ),
+        mode="wb",
     )
-    return df
+    manifest.setdefault("quantized", {})[dtype] = check
+    _write_atomic(BASE_TAGS_MANIFEST_FILE, lambda f: json.dump(manifest, f, indent=2))
+    return check
+
+
+def base_tags_version():
+    # Content hash of base_tags.csv, used to invalidate derived data
+    return ensure_compiled()["csv_sha256"]
+
+
+def load_base_tags():
+    # Names, scores, stop types and embedding norms; embeddings come from load_base_tag_embeddings
+    ensure_compiled()
+    return pd.read_csv(BASE_TAGS_META_FILE)
+
+
+def load_base_tag_embeddings(dtype=EMBEDDING_DTYPE):
+    """
+    The embedding matrix, memory-mapped so worker processes share one copy
+    of the pages. For float16 / int8 a QuantizedMatrix is returned, unless
+    that copy failed its accuracy check, in which case float32 is used.
+    """
+    manifest = ensure_compiled()
+    embeddings = np.load(BASE_TAGS_EMBEDDINGS_FILE, mmap_mode="r")
+    if check_dtype(dtype) == "float32":
+        return embeddings
+    data_file, rows_file = quantized_files(dtype)
+    check = manifest.get("quantized", {}).get(dtype)
+    if check is None or not (os.path.exists(data_file) and os.path.exists(rows_file)):
+        print(f"Quantizing base tag embeddings to {dtype}...")
+        check = compile_quantized(dtype, manifest)
+        print(
+            f"{dtype}: top-5 overlap {check['neighbor_overlap']:.3f}, "
+            f"scores within tolerance {check['scores_within']:.3f}, "
+            f"max score error {check['max_score_error']:.4f}"
+        )
+    if not check["passed"]:
+        print(f"{dtype} embeddings are outside the accuracy guardrails, using float32")
+        return embeddings
+    with np.load(rows_file) as rows:
+        scales = rows["scales"] if dtype == "int8" else None
+        norms = rows["norms"]
+    return QuantizedMatrix(np.load(data_file, mmap_mode="r"), scales, norms)
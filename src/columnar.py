@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.scoring import SCORE_COLUMNS, parse_tags
+
+""" config """
+# Low-cardinality text columns stored as categoricals
+CATEGORICAL_COLUMNS = ["stop_type", "time_slot", "season", "weather_label"]
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".feather": "feather"}
+
+
+def table_format(path):
+    _, ext = os.path.splitext(path)
+    if ext not in FORMATS:
+        raise Exception(f"Unsupported table format: {path} (use {', '.join(FORMATS)})")
+    return FORMATS[ext]
+
+
+def with_extension(path, fmt):
+    # Same file name with the extension of `fmt`
+    root, _ = os.path.splitext(path)
+    return f"{root}.{fmt}"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise Exception("Parquet/Feather files need pyarrow: pip install pyarrow")
+
+
+def to_columnar(df):
+    """Typed copy of `df`: tags as lists, scores as float32, categoricals."""
+    df = df.copy()
+    if "tags" in df:
+        df["tags"] = [parse_tags(value) for value in df["tags"]]
+    for column in SCORE_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype(np.float32)
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def write_table(df, path, **csv_kwargs):
+    """Write `df` as CSV, Parquet or Feather depending on the extension of `path`."""
+    fmt = table_format(path)
+    if fmt == "csv":
+        if "tags" in df and len(df) and not isinstance(df["tags"].iloc[0], str):
+            # Keep the string form of a Python list that the CSV files use
+            df = df.assign(tags=[str(list(value)) for value in df["tags"]])
+        df.to_csv(path, index=False, **csv_kwargs)
+        return
+    _require_pyarrow()
+    df = to_columnar(df)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_feather(path)
+
+
+def read_table(path, columns=None, **csv_kwargs):
+    """Read a table written by write_table; `columns` selects a subset."""
+    fmt = table_format(path)
+    if fmt == "csv":
+        return pd.read_csv(path, usecols=columns, **csv_kwargs)
+    _require_pyarrow()
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_feather(path, columns=columns)
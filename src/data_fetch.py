@@ -1,23 +1,161 @@
+import json
 import os
+import time
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.columnar import read_table, with_extension, write_table
+from src.metrics import metrics
 
 """ config """
 DATA_DIR = os.path.join(os.path.dirname(__file__), "../data")
 CACHE_DATA_FILE = os.path.join(DATA_DIR, "points_cache.csv")
-POINTS_API_ENDPOINT = "https://moca-jet.vercel.app/api/stops"
+# ETag / Last-Modified of the cached response and when it was last checked
+CACHE_META_FILE = os.path.join(DATA_DIR, "points_cache.meta.json")
+# Can point to a local stand-in server in tests
+POINTS_API_ENDPOINT = os.environ.get(
+    "MOCA_POINTS_API_ENDPOINT", "https://moca-jet.vercel.app/api/stops"
+)
+# The cache is used as-is for this long before the API is asked again
+CACHE_TTL_SECONDS = 24 * 60 * 60
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (5, 60)
+MAX_RETRIES = 3
 
+_session = None
 
-def load_data():
-    # Load data from cache or fetch from API if cache is not available.
-    if not os.path.exists(CACHE_DATA_FILE):
-        print("Fetching data from API...")
-        response = requests.get(POINTS_API_ENDPOINT)
-        if response.status_code == 200:
-            data = response.text
-            with open(CACHE_DATA_FILE, "w") as f:
-                f.write(data)
-        else:
+
+def get_session():
+    # One pooled session per process, with retries on transient failures
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        _session = requests.Session()
+        _session.mount("http://", HTTPAdapter(max_retries=retry))
+        _session.mount("https://", HTTPAdapter(max_retries=retry))
+        _session.headers["Accept-Encoding"] = "gzip"
+    return _session
+
+
+def _read_meta():
+    if not os.path.exists(CACHE_META_FILE):
+        return {}
+    with open(CACHE_META_FILE) as f:
+        return json.load(f)
+
+
+def _write_meta(meta):
+    tmp_path = f"{CACHE_META_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, CACHE_META_FILE)
+
+
+def _download(response, f):
+    """
+    Stream the (gunzipped) body into `f`. Later pages announced with a
+    `Link: <...>; rel="next"` header are appended without their CSV header.
+    """
+    for block in response.iter_content(chunk_size=1 << 16):
+        f.write(block)
+    while "next" in response.links:
+        response = get_session().get(
+            response.links["next"]["url"], timeout=REQUEST_TIMEOUT, stream=True
+        )
+        if response.status_code != 200:
             raise Exception(f"Failed to fetch data from API: {response.status_code}")
-    return pd.read_csv(CACHE_DATA_FILE)
+        lines = response.iter_lines(chunk_size=1 << 16)
+        next(lines, None)
+        for line in lines:
+            f.write(line + b"\n")
+
+
+def fetch_data(endpoint=POINTS_API_ENDPOINT, force=False):
+    """
+    Refresh the points cache. Within CACHE_TTL_SECONDS of the last check
+    nothing is requested; after that a conditional request is sent and a
+    304 keeps the cache. A new body is written atomically.
+    Returns True if the cache file changed.
+    """
+    meta = _read_meta()
+    has_cache = os.path.exists(CACHE_DATA_FILE)
+    if has_cache and not force:
+        # A cache written without metadata counts as checked when it was written
+        checked_at = meta.get("checked_at", os.path.getmtime(CACHE_DATA_FILE))
+        if time.time() - checked_at < CACHE_TTL_SECONDS:
+            return False
+
+    headers = {}
+    if has_cache and meta.get("url") == endpoint:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    print("Fetching data from API...")
+    response = get_session().get(endpoint, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+    if response.status_code == 304:
+        meta["checked_at"] = time.time()
+        _write_meta(meta)
+        return False
+    if response.status_code != 200:
+        raise Exception(f"Failed to fetch data from API: {response.status_code}")
+
+    tmp_path = f"{CACHE_DATA_FILE}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            _download(response, f)
+        os.replace(tmp_path, CACHE_DATA_FILE)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _write_meta(
+        {
+            "url": endpoint,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "checked_at": time.time(),
+        }
+    )
+    return True
+
+
+def ensure_cache():
+    # Refresh the cache when it is stale; keep using it if the API is unreachable
+    try:
+        with metrics.stage("fetch"):
+            fetch_data()
+    except Exception as e:
+        if not os.path.exists(CACHE_DATA_FILE):
+            raise
+        print(f"Using cached data, refresh failed: {e}")
+    return CACHE_DATA_FILE
+
+
+def load_data(fmt="csv"):
+    # Load data from cache or fetch from API if cache is not available.
+    path = ensure_cache()
+    if fmt == "csv":
+        return pd.read_csv(path)
+    # Typed columnar copy of the cache, rebuilt whenever the CSV is newer
+    columnar_path = with_extension(path, fmt)
+    if not os.path.exists(columnar_path) or os.path.getmtime(columnar_path) < os.path.getmtime(
+        path
+    ):
+        write_table(pd.read_csv(path), columnar_path)
+    return read_table(columnar_path)
+
+
+def iter_data(chunk_size, skip_chunks=0):
+    """Yield the points in DataFrames of `chunk_size` rows, skipping the first `skip_chunks`."""
+    skip_rows = range(1, skip_chunks * chunk_size + 1) if skip_chunks else None
+    for chunk in pd.read_csv(ensure_cache(), chunksize=chunk_size, skiprows=skip_rows):
+        yield chunk.reset_index(drop=True)
@@ -27,61 +27,28 @@
   運行履歴系    : 前回運行からの経過日数
 """
 
+import os
 import pandas as pd
 import numpy as np
-from datetime import date, timedelta
+from datetime import date
+
+from src.columnar import write_table
+from src.features import add_days_since_last, add_lag_features
+from src.holiday_calendar import (
+    FARMING_MONTHS, HOLIDAYS, SEASON_BY_MONTH, build_calendar, calendar_for,
+)
 
 SEED = 42
-np.random.seed(SEED)
 
 START_DATE = date(2020, 4, 1)
 END_DATE   = date(2025, 3, 31)
 TIME_SLOTS = ["morning", "daytime", "evening"]
 
 # ─────────────────────────────────────────
-# 1. 祝日定義（2020〜2025）
+# 1〜3. カレンダー系ヘルパー（src/holiday_calendar.py の事前計算表を参照）
 # ─────────────────────────────────────────
-HOLIDAYS = set([
-    # 2020
-    "2020-01-01","2020-01-13","2020-02-11","2020-02-23","2020-02-24",
-    "2020-03-20","2020-04-29","2020-05-03","2020-05-04","2020-05-05",
-    "2020-05-06","2020-07-23","2020-07-24","2020-08-10","2020-09-21",
-    "2020-09-22","2020-11-03","2020-11-23",
-    # 2021
-    "2021-01-01","2021-01-11","2021-02-11","2021-02-23","2021-03-20",
-    "2021-04-29","2021-05-03","2021-05-04","2021-05-05","2021-07-22",
-    "2021-07-23","2021-08-08","2021-08-09","2021-09-20","2021-09-23",
-    "2021-11-03","2021-11-23",
-    # 2022
-    "2022-01-01","2022-01-10","2022-02-11","2022-02-23","2022-03-21",
-    "2022-04-29","2022-05-03","2022-05-04","2022-05-05","2022-07-18",
-    "2022-08-11","2022-09-19","2022-09-23","2022-10-10","2022-11-03",
-    "2022-11-23","2022-12-31",
-    # 2023
-    "2023-01-01","2023-01-02","2023-01-09","2023-02-11","2023-02-23",
-    "2023-03-21","2023-04-29","2023-05-03","2023-05-04","2023-05-05",
-    "2023-07-17","2023-08-11","2023-09-18","2023-09-23","2023-10-09",
-    "2023-11-03","2023-11-23",
-    # 2024
-    "2024-01-01","2024-01-08","2024-02-11","2024-02-12","2024-02-23",
-    "2024-03-20","2024-04-29","2024-05-03","2024-05-04","2024-05-05",
-    "2024-05-06","2024-07-15","2024-08-11","2024-08-12","2024-09-16",
-    "2024-09-22","2024-09-23","2024-10-14","2024-11-03","2024-11-04",
-    "2024-11-23",
-    # 2025
-    "2025-01-01","2025-01-13","2025-02-11","2025-02-23","2025-02-24",
-    "2025-03-20",
-])
-
 def is_holiday(d: date) -> bool:
-    return d.isoformat() in HOLIDAYS
-
-
-# ─────────────────────────────────────────
-# 2. 連休カウント（当日が連休の何日目か）
-# ─────────────────────────────────────────
-def _is_non_workday(d: date) -> bool:
-    return d.weekday() >= 5 or is_holiday(d)
+    return d in _HOLIDAY_SET
 
 def consecutive_holiday_count(d: date) -> int:
     """
@@ -89,46 +56,27 @@ def consecutive_holiday_count(d: date) -> int:
     平日なら0。
     GW・年末年始・シルバーウィーク等を自然に捉える。
     """
-    if not _is_non_workday(d):
-        return 0
-    count = 1
-    prev = d - timedelta(days=1)
-    while _is_non_workday(prev):
-        count += 1
-        prev -= timedelta(days=1)
-    return count
+    return int(calendar_for(d).lookup("consecutive_holiday_count", d))
 
-
-# ─────────────────────────────────────────
-# 3. カレンダー系ヘルパー
-# ─────────────────────────────────────────
 def get_season(month: int) -> str:
-    if month in (3, 4, 5):   return "spring"
-    if month in (6, 7, 8):   return "summer"
-    if month in (9, 10, 11): return "autumn"
-    return "winter"
+    return SEASON_BY_MONTH[month]
 
 def is_school_term(d: date) -> bool:
     """広島県の学校カレンダーに準拠した学期中フラグ"""
-    m, day = d.month, d.day
-    if m == 7 and day >= 21: return False  # 夏休み
-    if m == 8:               return False
-    if m == 12 and day >= 25: return False  # 冬休み
-    if m == 1 and day <= 7:   return False
-    if m == 3 and day >= 25:  return False  # 春休み
-    if m == 4 and day <= 7:   return False
-    if d.weekday() >= 5:      return False  # 土日
-    return True
+    return bool(calendar_for(d).lookup("is_school_term", d))
 
 def is_farming_season(month: int) -> bool:
     """農繁期（田植え5〜6月・収穫9〜10月）フラグ"""
-    return month in (5, 6, 9, 10)
+    return month in FARMING_MONTHS
 
 def is_month_boundary(day: int) -> bool:
     """月初（1〜5日）・月末（25日〜）: 通院予約が集中"""
     return day <= 5 or day >= 25
 
 
+_HOLIDAY_SET = frozenset(date.fromisoformat(d) for d in HOLIDAYS)
+
+
 # ─────────────────────────────────────────
 # 4. 気象シミュレーター
 # ─────────────────────────────────────────
@@ -145,42 +93,42 @@ MONTHLY_RAIN_PROB = {
     9:0.32,10:0.22,11:0.22,12:0.20,
 }
 
-def simulate_weather(d: date) -> dict:
-    m = d.month
-    mean_t, std_t = MONTHLY_TEMP[m]
-    temperature = round(np.random.normal(mean_t, std_t), 1)
+# 添字 = 月 の配列版
+_TEMP_MEAN = np.array([0.0] + [MONTHLY_TEMP[m][0] for m in range(1, 13)])
+_TEMP_STD  = np.array([0.0] + [MONTHLY_TEMP[m][1] for m in range(1, 13)])
+_RAIN_PROB = np.array([0.0] + [MONTHLY_RAIN_PROB[m] for m in range(1, 13)])
 
-    is_rainy = np.random.random() < MONTHLY_RAIN_PROB[m]
-    precipitation_mm = 0.0
-    if is_rainy:
-        precipitation_mm = round(np.random.exponential(8.0), 1)
 
-    snowfall_cm = 0.0
-    if m in (1, 2) and temperature <= 0 and is_rainy:
-        snowfall_cm = round(np.random.exponential(3.0), 1)
+def simulate_weather(months: np.ndarray, rng: np.random.Generator) -> dict:
+    """
+    1日1回の気象を、月の配列に対してまとめてサンプリングする。
+    先頭の軸以外（レプリケート等）を持つ配列にもそのまま使える。
+    """
+    shape = months.shape
+    temperature = np.round(rng.normal(_TEMP_MEAN[months], _TEMP_STD[months]), 1)
+
+    is_rainy = rng.random(shape) < _RAIN_PROB[months]
+    precipitation_mm = np.where(is_rainy, np.round(rng.exponential(8.0, shape), 1), 0.0)
 
-    wind_speed = round(np.random.exponential(2.5), 1)
+    is_snowy = np.isin(months, (1, 2)) & (temperature <= 0) & is_rainy
+    snowfall_cm = np.where(is_snowy, np.round(rng.exponential(3.0, shape), 1), 0.0)
 
-    if snowfall_cm > 0:
-        weather_label = "snowy"
-    elif is_rainy:
-        weather_label = "rainy"
-    elif np.random.random() < 0.4:
-        weather_label = "cloudy"
-    else:
-        weather_label = "sunny"
+    wind_speed = np.round(rng.exponential(2.5, shape), 1)
+
+    is_cloudy = rng.random(shape) < 0.4
+    weather_label = np.where(
+        snowfall_cm > 0, "snowy",
+        np.where(is_rainy, "rainy", np.where(is_cloudy, "cloudy", "sunny")),
+    ).astype(object)
 
     # 【新規】体感温度（Steadman式の簡易版）
     # 気温が10℃以上かつ風速が強い場合に体感温度が下がる
-    feels_like = temperature - 0.4 * max(wind_speed - 2.0, 0)
-    feels_like = round(feels_like, 1)
+    feels_like = np.round(temperature - 0.4 * np.maximum(wind_speed - 2.0, 0), 1)
 
     # 【新規】悪天候フラグ（大雨・大雪・強風のいずれか）
-    is_extreme_weather = int(
-        precipitation_mm >= 20 or
-        snowfall_cm >= 5 or
-        wind_speed >= 10
-    )
+    is_extreme_weather = (
+        (precipitation_mm >= 20) | (snowfall_cm >= 5) | (wind_speed >= 10)
+    ).astype(np.int64)
 
     return {
         "temperature"       : temperature,
@@ -206,236 +154,215 @@ MONTHLY_COEF = {
     8: 0.697, 9: 0.848, 10: 0.753,
     11: 0.798, 12: 0.725,
 }
+_MONTHLY_COEF = np.array([0.0] + [MONTHLY_COEF[m] for m in range(1, 13)])
 
-def base_lambda(d: date, slot: str, weather: dict) -> float:
+# 時間帯の基礎需要
+# 実データの便別平均（2便が最多、朝夕が中程度）を参考に設定
+# ゼロ率78%を実現するため全体的にλを抑える
+SLOT_BASE = {"morning": 0.32, "daytime": 0.40, "evening": 0.22}
+
+
+def _select(conditions, factors):
+    # 最初に当てはまった条件の係数（どれにも当てはまらなければ1.0）
+    return np.select(conditions, factors, default=1.0)
+
+
+def base_lambda(calendar, weather: dict) -> np.ndarray:
     """
-    ポアソン分布の λ（期待需要数）を状況に応じて計算する。
+    ポアソン分布の λ（期待需要数）を 日 × 時間帯 の配列でまとめて計算する。
+    calendar（CalendarTable または同じキーの dict）/ weather の各配列は
+    同じ形（日の軸）で、戻り値は末尾に
+    時間帯の軸（TIME_SLOTS の順）が付く。
     実データEDA（2023〜2025年度）に基づき係数を較正。
     ゼロ需要率: 実データ78.4%に合わせて基礎λを下げる。
     """
-    # ── 時間帯の基礎需要 ──
-    # 実データの便別平均（2便が最多、朝夕が中程度）を参考に設定
-    # ゼロ率78%を実現するため全体的にλを抑える
-    slot_base = {"morning": 0.32, "daytime": 0.40, "evening": 0.22}
-    lam = slot_base[slot]
+    day = lambda x: np.asarray(x)[..., None]
+    return np.maximum(calendar_lambda(calendar) * day(weather_factor(weather)), 0.0)
+
 
-    # ── 月別補正（実データ較正）──
-    lam *= MONTHLY_COEF[d.month]
+def calendar_lambda(calendar) -> np.ndarray:
+    """気象補正前の λ（日 × 時間帯）。時間帯・月・カレンダーによる補正のみ"""
+    day = lambda x: np.asarray(x)[..., None]   # 日の配列を時間帯方向に広げる
+    morning = np.array([s == "morning" for s in TIME_SLOTS])
+    daytime = np.array([s == "daytime" for s in TIME_SLOTS])
+    evening = np.array([s == "evening" for s in TIME_SLOTS])
+
+    # ── 時間帯の基礎需要 × 月別補正（実データ較正）──
+    lam = np.array([SLOT_BASE[s] for s in TIME_SLOTS]) * day(_MONTHLY_COEF[calendar["month"]])
 
     # ── カレンダー補正 ──
-    is_we   = d.weekday() >= 5
-    is_hol  = is_holiday(d)
-    school  = is_school_term(d)
-    farming = is_farming_season(d.month)
-    boundary = is_month_boundary(d.day)
-
-    if is_we or is_hol:
-        # 実データ: 週末は平日の約0.49倍
-        lam *= 0.49
-        # daytimeは観光・買い物需要でやや戻る
-        if slot == "daytime":
-            lam *= 1.25
-    else:
-        # 平日
-        if school and slot == "morning":
-            # 学期中の朝: 通学需要UP
-            lam *= 1.40
-        if not school and slot == "morning":
-            # 長期休暇中の朝: 通学ゼロ
-            lam *= 0.40
+    off    = day(calendar["is_weekend"] | calendar["is_holiday"])
+    school = day(calendar["is_school_term"])
+    lam = lam * np.where(
+        off,
+        # 実データ: 週末は平日の約0.49倍（daytimeは観光・買い物需要でやや戻る）
+        np.where(daytime, 0.49 * 1.25, 0.49),
+        # 平日: 学期中の朝は通学需要UP、長期休暇中の朝は通学ゼロ
+        np.where(morning, np.where(school, 1.40, 0.40), 1.0),
+    )
 
     # 農繁期（農家の移動需要）
-    if farming and slot in ("morning", "evening"):
-        lam *= 1.15
+    lam = lam * np.where(day(calendar["is_farming_season"]) & (morning | evening), 1.15, 1.0)
 
     # 月初月末（通院需要: 実データで約1.82倍）
-    if boundary and slot == "daytime":
-        lam *= 1.82
+    lam = lam * np.where(day(calendar["is_month_boundary"]) & daytime, 1.82, 1.0)
+
+    # 【新規】連休効果: 長期連休中は需要を抑制
+    return lam * day(np.where(calendar["consecutive_holiday_count"] >= 3, 0.70, 1.0))
 
-    # 【新規】連休効果: 連休が長いほど需要が蓄積されやすい
-    con_hol = consecutive_holiday_count(d)
-    if con_hol >= 3:
-        # 長期連休明けは需要が増える（翌日に反映するためここでは抑制）
-        lam *= 0.70
 
-    # ── 気象補正 ──
-    t   = weather["temperature"]
+def weather_factor(weather: dict) -> np.ndarray:
+    """気象による λ の補正係数（気象の配列と同じ形、時間帯共通）"""
     prp = weather["precipitation_mm"]
     snw = weather["snowfall_cm"]
     wnd = weather["wind_speed"]
     flt = weather["feels_like_temp"]
-
-    # 体感温度ベースの快適性補正（従来の気温補正を置き換え）
-    if flt >= 35 or flt <= -3:
-        lam *= 0.45   # 極端な暑さ・寒さ
-    elif flt >= 30 or flt <= 1:
-        lam *= 0.72
-    elif 14 <= flt <= 24:
-        lam *= 1.10   # 快適な体感温度
-
-    # 降水量
-    if prp >= 20:
-        lam *= 0.40   # 大雨
-    elif prp >= 5:
-        lam *= 0.65   # 中雨
-    elif prp > 0:
-        lam *= 0.82   # 小雨
-
-    # 積雪（山間部は特に影響大）
-    if snw >= 10:
-        lam *= 0.20
-    elif snw > 0:
-        lam *= 0.50
-
-    # 強風
-    if wnd >= 10:
-        lam *= 0.70
-    elif wnd >= 7:
-        lam *= 0.85
-
-    return max(lam, 0.0)
+    return (
+        # 体感温度ベースの快適性補正（極端な暑さ・寒さ / やや厳しい / 快適）
+        _select([(flt >= 35) | (flt <= -3), (flt >= 30) | (flt <= 1), (flt >= 14) & (flt <= 24)],
+                [0.45, 0.72, 1.10])
+        # 降水量（大雨 / 中雨 / 小雨）
+        * _select([prp >= 20, prp >= 5, prp > 0], [0.40, 0.65, 0.82])
+        # 積雪（山間部は特に影響大）
+        * _select([snw >= 10, snw > 0], [0.20, 0.50])
+        # 強風
+        * _select([wnd >= 10, wnd >= 7], [0.70, 0.85])
+    )
 
 
 # ─────────────────────────────────────────
-# 6. 前回運行からの経過日数を計算するためのリスト
+# 7. 全レコード生成（日 × 時間帯 のグリッドを一括計算）
 # ─────────────────────────────────────────
-def compute_days_since_last_operation(dates_series: pd.Series) -> pd.Series:
+def generate_records(start: date = START_DATE, end: date = END_DATE,
+                     rng: np.random.Generator | None = None) -> pd.DataFrame:
     """
-    各日付について、前回需要があった日からの経過日数を返す。
-    demand_countが1以上の日を「運行日」とみなす。
+    期間内の全日 × 全時間帯について、カレンダー・気象・需要数を配列で生成する。
+    行の並びは 日付 → TIME_SLOTS の順。
     """
-    result = []
-    last_op = None
-    for d in dates_series:
-        if last_op is None:
-            result.append(np.nan)
-        else:
-            result.append((d - last_op).days)
-        last_op = d  # 毎日更新（需要有無に関わらず）
-    return pd.Series(result, index=dates_series.index)
+    if rng is None:
+        rng = np.random.default_rng(SEED)
+    calendar = build_calendar(start, end)
+    weather = simulate_weather(calendar["month"], rng)
+    counts = rng.poisson(base_lambda(calendar, weather))
+    return records_frame(calendar, weather, counts)
 
 
-# ─────────────────────────────────────────
-# 7. 全レコード生成
-# ─────────────────────────────────────────
-records = []
-current = START_DATE
-
-while current <= END_DATE:
-    weather = simulate_weather(current)
-    season  = get_season(current.month)
-    con_hol = consecutive_holiday_count(current)
-
-    for slot in TIME_SLOTS:
-        lam   = base_lambda(current, slot, weather)
-        count = int(np.random.poisson(lam))
-
-        records.append({
-            # ── 識別子 ──
-            "date"                    : current.isoformat(),
-            "time_slot"               : slot,
-
-            # ── 目的変数 ──
-            "demand_count"            : count,
-
-            # ── カレンダー特徴量 ──
-            "day_of_week"             : current.weekday(),
-            "month"                   : current.month,
-            "is_weekend"              : int(current.weekday() >= 5),
-            "is_holiday"              : int(is_holiday(current)),
-            "is_school_term"          : int(is_school_term(current)),
-            "is_farming_season"       : int(is_farming_season(current.month)),
-            "is_month_boundary"       : int(is_month_boundary(current.day)),
-            "season"                  : season,
-            "consecutive_holiday_count": con_hol,  # 【新規】
-
-            # ── 気象特徴量 ──
-            "temperature"             : weather["temperature"],
-            "feels_like_temp"         : weather["feels_like_temp"],    # 【新規】
-            "precipitation_mm"        : weather["precipitation_mm"],
-            "snowfall_cm"             : weather["snowfall_cm"],
-            "wind_speed"              : weather["wind_speed"],
-            "weather_label"           : weather["weather_label"],
-            "is_extreme_weather"      : weather["is_extreme_weather"], # 【新規】
-        })
-
-    current += timedelta(days=1)
-
-df = pd.DataFrame(records)
-
-
-# ─────────────────────────────────────────
-# 8. ラグ特徴量の付与（時間帯ごとに独立して計算）
-# ─────────────────────────────────────────
-df = df.sort_values(["time_slot", "date"]).reset_index(drop=True)
+def day_columns(calendar, weather: dict) -> dict:
+    """1日1行のカレンダー・気象特徴量（日付 + 列名 → 日の配列）"""
+    return {
+        "date"                    : np.datetime_as_string(calendar.dates).astype(object),
+
+        # ── カレンダー特徴量 ──
+        "day_of_week"             : calendar["day_of_week"],
+        "month"                   : calendar["month"],
+        "is_weekend"              : calendar["is_weekend"].astype(np.int64),
+        "is_holiday"              : calendar["is_holiday"].astype(np.int64),
+        "is_school_term"          : calendar["is_school_term"].astype(np.int64),
+        "is_farming_season"       : calendar["is_farming_season"].astype(np.int64),
+        "is_month_boundary"       : calendar["is_month_boundary"].astype(np.int64),
+        "season"                  : calendar["season"],
+        "consecutive_holiday_count": calendar["consecutive_holiday_count"],  # 【新規】
+
+        # ── 気象特徴量 ──
+        "temperature"             : weather["temperature"],
+        "feels_like_temp"         : weather["feels_like_temp"],    # 【新規】
+        "precipitation_mm"        : weather["precipitation_mm"],
+        "snowfall_cm"             : weather["snowfall_cm"],
+        "wind_speed"              : weather["wind_speed"],
+        "weather_label"           : weather["weather_label"],
+        "is_extreme_weather"      : weather["is_extreme_weather"], # 【新規】
+    }
 
-for slot in TIME_SLOTS:
-    mask = df["time_slot"] == slot
-    s    = df.loc[mask, "demand_count"]
 
-    df.loc[mask, "lag_1_demand"]      = s.shift(1)
-    df.loc[mask, "lag_7_demand"]      = s.shift(7)
-    df.loc[mask, "lag_14_demand"]     = s.shift(14)
-    df.loc[mask, "rolling_7day_avg"]  = s.shift(1).rolling(7,  min_periods=1).mean().round(2)
-    df.loc[mask, "rolling_14day_avg"] = s.shift(1).rolling(14, min_periods=1).mean().round(2)
+def records_frame(calendar, weather: dict, counts: np.ndarray) -> pd.DataFrame:
+    """
+    1実現分（気象は日の配列、counts は 日 × 時間帯）を
+    日付 → TIME_SLOTS の順の DataFrame にする。
+    """
+    n_slots = len(TIME_SLOTS)
+    columns = {name: np.repeat(np.asarray(values), n_slots)
+               for name, values in day_columns(calendar, weather).items()}
+    return pd.DataFrame({
+        # ── 識別子 ──
+        "date"        : columns.pop("date"),
+        "time_slot"   : np.tile(np.array(TIME_SLOTS, dtype=object), len(calendar)),
 
-# ラグが計算できない先頭行は除去
-df = df.dropna(subset=["lag_7_demand"]).reset_index(drop=True)
+        # ── 目的変数 ──
+        "demand_count": counts.ravel(),
 
-# 日付順に並べ直す
-df = df.sort_values(["date", "time_slot"]).reset_index(drop=True)
+        # ── カレンダー・気象特徴量 ──
+        **columns,
+    })
 
 
 # ─────────────────────────────────────────
-# 9. 前回運行からの経過日数（time_slotごとに計算）
+# 8. ラグ特徴量の付与（時間帯ごとに独立して計算、src/features.py）
 # ─────────────────────────────────────────
-df["date_parsed"] = pd.to_datetime(df["date"])
+def add_dummy_features(df: pd.DataFrame) -> pd.DataFrame:
+    df = add_lag_features(df, group_cols=["time_slot"])
+
+    # ラグが計算できない先頭行は除去
+    df = df.dropna(subset=["lag_7_demand"]).reset_index(drop=True)
 
-for slot in TIME_SLOTS:
-    mask = df["time_slot"] == slot
-    slot_df = df[mask].copy()
-    days_since = compute_days_since_last_operation(slot_df["date_parsed"])
-    df.loc[mask, "days_since_last_operation"] = days_since.values
+    # 日付順に並べ直す
+    df = df.sort_values(["date", "time_slot"]).reset_index(drop=True)
 
-df = df.drop(columns=["date_parsed"])
+    # ─────────────────────────────────────────
+    # 9. 前回運行からの経過日数（time_slotごとに計算）
+    # ─────────────────────────────────────────
+    return add_days_since_last(df, group_cols=["time_slot"])
+
+
+def generate_dataset(start: date = START_DATE, end: date = END_DATE,
+                     rng: np.random.Generator | None = None) -> pd.DataFrame:
+    """ダミーデータ一式（レコード生成 + ラグ・経過日数特徴量）"""
+    return add_dummy_features(generate_records(start, end, rng))
 
 
 # ─────────────────────────────────────────
 # 10. 保存 & サマリー
 # ─────────────────────────────────────────
-DUMMY_FILE = "./data/dummy.csv"
-df.to_csv(DUMMY_FILE, index=False, encoding="utf-8-sig")
+# 拡張子で形式を選択（.csv / .parquet / .feather）
+DUMMY_FILE = os.environ.get("MOCA_DUMMY_FILE", "./data/dummy.csv")
+
+
+def print_summary(df: pd.DataFrame) -> None:
+    print(f"✅ 生成完了: {len(df)} レコード（ゼロ需要含む）")
+    print(f"   期間: {df['date'].min()} 〜 {df['date'].max()}")
+    print(f"   保存先: {DUMMY_FILE}")
+    print(f"   列数: {len(df.columns)}")
+
+    print("\n── 需要数の分布 ──")
+    print(df["demand_count"].value_counts().sort_index().to_string())
 
-print(f"✅ 生成完了: {len(df)} レコード（ゼロ需要含む）")
-print(f"   期間: {df['date'].min()} 〜 {df['date'].max()}")
-print(f"   保存先: {DUMMY_FILE}")
-print(f"   列数: {len(df.columns)}")
+    print("\n── ゼロ需要の割合 ──")
+    zero_ratio = (df["demand_count"] == 0).mean()
+    print(f"   {zero_ratio:.1%}（実データ: 78.4%）")
 
-print("\n── 需要数の分布 ──")
-print(df["demand_count"].value_counts().sort_index().to_string())
+    print("\n── 時間帯別 平均需要数 ──")
+    print(df.groupby("time_slot")["demand_count"].mean().round(3).to_string())
 
-print("\n── ゼロ需要の割合 ──")
-zero_ratio = (df["demand_count"] == 0).mean()
-print(f"   {zero_ratio:.1%}（実データ: 78.4%）")
+    print("\n── 月別 平均需要数 ──")
+    print(df.groupby("month")["demand_count"].mean().round(3).to_string())
 
-print("\n── 時間帯別 平均需要数 ──")
-print(df.groupby("time_slot")["demand_count"].mean().round(3).to_string())
+    print("\n── 曜日別 平均需要数（0=月〜6=日）──")
+    print(df.groupby("day_of_week")["demand_count"].mean().round(3).to_string())
 
-print("\n── 月別 平均需要数 ──")
-print(df.groupby("month")["demand_count"].mean().round(3).to_string())
+    print("\n── 天候ラベル別 平均需要数 ──")
+    print(df.groupby("weather_label")["demand_count"].mean().round(3).to_string())
 
-print("\n── 曜日別 平均需要数（0=月〜6=日）──")
-print(df.groupby("day_of_week")["demand_count"].mean().round(3).to_string())
+    print("\n── 悪天候フラグ別 平均需要数 ──")
+    print(df.groupby("is_extreme_weather")["demand_count"].mean().round(3).to_string())
 
-print("\n── 天候ラベル別 平均需要数 ──")
-print(df.groupby("weather_label")["demand_count"].mean().round(3).to_string())
+    print("\n── 連休カウント別 平均需要数 ──")
+    print(df.groupby("consecutive_holiday_count")["demand_count"].mean().round(3).to_string())
 
-print("\n── 悪天候フラグ別 平均需要数 ──")
-print(df.groupby("is_extreme_weather")["demand_count"].mean().round(3).to_string())
+    print("\n── 列一覧 ──")
+    for col in df.columns:
+        print(f"   {col}")
 
-print("\n── 連休カウント別 平均需要数 ──")
-print(df.groupby("consecutive_holiday_count")["demand_count"].mean().round(3).to_string())
 
-print("\n── 列一覧 ──")
-for col in df.columns:
-    print(f"   {col}")
\ No newline at end of file
+if __name__ == "__main__":
+    df = generate_dataset(rng=np.random.default_rng(SEED))
+    write_table(df, DUMMY_FILE, encoding="utf-8-sig")
+    print_summary(df)
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+from src.quantize import EMBEDDING_DTYPE, check_dtype, decode_vector, encode_vector, storage_tag
+from src.sqlite_store import connect, select_in
+
+""" config """
+DATA_DIR = os.path.join(os.path.dirname(__file__), "../data")
+EMBEDDING_CACHE_FILE = os.path.join(DATA_DIR, "embedding_cache.sqlite")
+# Number of vectors kept in the in-process LRU
+MEMORY_CACHE_SIZE = 10_000
+# Size limit of the stored vectors; least recently used ones are evicted first
+MAX_STORE_BYTES = 512 * 1024 * 1024
+
+
+def cache_key(model_name, text):
+    # Content address of an embedding: the model and the exact text
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by model name and text: an in-process LRU in front
+    of a persistent SQLite store. Pass `path=None` to keep it in memory only.
+    """
+
+    def __init__(
+        self,
+        path=EMBEDDING_CACHE_FILE,
+        memory_size=MEMORY_CACHE_SIZE,
+        max_store_bytes=MAX_STORE_BYTES,
+        dtype=EMBEDDING_DTYPE,
+    ):
+        self.path = path
+        # Vectors are stored as float32, float16 or int8; reads give float32
+        self.dtype = check_dtype(dtype)
+        # Rows stored with another dtype are misses, and rewritten when encoded again
+        self.tag = storage_tag(self.dtype)
+        self.memory_size = memory_size
+        self.max_store_bytes = max_store_bytes
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = None
+        self._store_bytes = None
+
+    @property
+    def conn(self):
+        # Open the store on first use so that importing stays cheap
+        if self._conn is None and self.path is not None:
+            self._conn = connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, dtype TEXT, vector BLOB, last_used REAL)"
+            )
+        return self._conn
+
+    def _remember(self, key, vector):
+        vector.flags.writeable = False
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def get_many(self, model_name, texts):
+        """Return a list aligned with `texts` holding the vector or None."""
+        keys = [cache_key(model_name, text) for text in texts]
+        found = {}
+        for key in keys:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                found[key] = self.memory[key]
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing and self.conn is not None:
+            now = time.time()
+            rows = select_in(
+                self.conn, "SELECT key, dtype, vector FROM embeddings WHERE key IN ({marks})", missing
+            )
+            rows = [row for row in rows if row[1] == self.tag]
+            for key, dtype, blob in rows:
+                vector = decode_vector(dtype, blob)
+                found[key] = vector
+                self._remember(key, vector)
+            if rows:
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key, _, _ in rows],
+                )
+        vectors = [found.get(key) for key in keys]
+        hits = sum(vector is not None for vector in vectors)
+        self.hits += hits
+        self.misses += len(vectors) - hits
+        return vectors
+
+    def get(self, model_name, text):
+        return self.get_many(model_name, [text])[0]
+
+    def put_many(self, model_name, texts, vectors):
+        """
+        Store the vectors; returns them as later reads will see them, i.e.
+        after the round trip through the storage dtype.
+        """
+        rows = []
+        stored = []
+        now = time.time()
+        for text, vector in zip(texts, vectors):
+            key = cache_key(model_name, text)
+            tag, blob = encode_vector(vector, self.dtype)
+            vector = decode_vector(tag, blob)
+            self._remember(key, vector)
+            stored.append(vector)
+            rows.append((key, tag, blob, now))
+        if rows and self.conn is not None:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dtype, vector, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            if self._store_bytes is not None:
+                self._store_bytes += sum(len(row[2]) for row in rows)
+            self.evict()
+        return stored
+
+    def put(self, model_name, text, vector):
+        return self.put_many(model_name, [text], [vector])[0]
+
+    def store_bytes(self):
+        if self.conn is None:
+            return 0
+        self._store_bytes = self.conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+        return self._store_bytes
+
+    def evict(self):
+        # Drop least recently used vectors until the store fits the limit.
+        # The running total may drift when other processes write, so it is
+        # only a trigger for an exact recount.
+        if self._store_bytes is not None and self._store_bytes <= self.max_store_bytes:
+            return
+        excess = self.store_bytes() - self.max_store_bytes
+        if excess <= 0:
+            return
+        freed = 0
+        victims = []
+        cursor = self.conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"
+        )
+        for key, size in cursor:
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        cursor.close()
+        self.conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        self.evictions += len(victims)
+        self._store_bytes -= freed
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self.memory),
+            "store_bytes": self.store_bytes(),
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
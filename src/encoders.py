@@ -0,0 +1,74 @@
+import hashlib
+
+import numpy as np
+
+""" config """
+MODEL_NAME = "intfloat/multilingual-e5-small"
+# Dimension of intfloat/multilingual-e5-small, also used by the hashing encoder
+EMBEDDING_DIM = 384
+
+
+class SentenceTransformerEncoder:
+    """Sentence-transformers model, loaded on the first encode call."""
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.name = model_name
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            # Imported here so that exact-hit-only runs never load torch
+            from sentence_transformers import SentenceTransformer
+
+            self._model = SentenceTransformer(self.name)
+        return self._model
+
+    @property
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=64):
+        return np.asarray(self.model.encode(list(texts), batch_size=batch_size), dtype=np.float32)
+
+
+class HashingEncoder:
+    """
+    Deterministic offline stand-in for tests, benchmarks and air-gapped CI.
+    Character 1-3 grams are hashed into signed buckets and L2-normalized, so
+    texts sharing characters get similar vectors. The vectors are not
+    comparable with real model embeddings.
+    """
+
+    def __init__(self, dimension=EMBEDDING_DIM):
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}"
+
+    def _encode_one(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for n in (1, 2, 3):
+            for i in range(len(text) - n + 1):
+                digest = hashlib.blake2b(text[i : i + n].encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                sign = 1.0 if value & 1 else -1.0
+                vector[(value >> 1) % self.dimension] += sign
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, batch_size=64):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            vectors[i] = self._encode_one(text)
+        return vectors
+
+
+ENCODERS = {
+    "sentence-transformers": SentenceTransformerEncoder,
+    "hashing": HashingEncoder,
+}
+
+
+def make_encoder(name):
+    if name not in ENCODERS:
+        raise Exception(f"Unknown encoder: {name} (choose from {', '.join(ENCODERS)})")
+    return ENCODERS[name]()
@@ -0,0 +1,116 @@
+"""
+需要ログ（ダミー・実データ共通）のラグ・移動平均・経過日数特徴量。
+
+  add_lag_features   : 全期間をグループ単位のベクトル演算で一括計算
+  add_days_since_last: 前回レコードからの経過日数
+  LagState           : グループごとの直近 MAX_LAG 件だけを保持し、
+                       追加された日の特徴量を履歴の長さに依存せず計算する
+
+1グループ = 1時系列（既定は time_slot。複数停留所なら ["stop_id", "time_slot"]）。
+ラグは同じグループ内の「前の行」を基準にする。
+"""
+
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+LAGS = (1, 7, 14)
+ROLLING_WINDOWS = (7, 14)
+MAX_LAG = max(max(LAGS), max(ROLLING_WINDOWS))
+LAG_COLUMNS = [f"lag_{k}_demand" for k in LAGS] + [f"rolling_{w}day_avg" for w in ROLLING_WINDOWS]
+
+
+def add_lag_features(df: pd.DataFrame, group_cols=("time_slot",), date_col: str = "date",
+                     target: str = "demand_count") -> pd.DataFrame:
+    """
+    グループ × 日付順に並べ、lag_1/7/14_demand と rolling_7/14day_avg
+    （前日までの平均、小数2桁）を付与する。戻り値はグループ × 日付順。
+    """
+    group_cols = list(group_cols)
+    df = df.sort_values([*group_cols, date_col]).reset_index(drop=True)
+    groups = df.groupby(group_cols, sort=False)[target]
+
+    for k in LAGS:
+        df[f"lag_{k}_demand"] = groups.shift(k)
+
+    # 前日までの値で移動平均（当日の値は含めない）
+    previous = df["lag_1_demand"]
+    keys = [df[c] for c in group_cols]
+    for w in ROLLING_WINDOWS:
+        rolled = previous.groupby(keys, sort=False).rolling(w, min_periods=1).mean()
+        rolled = rolled.reset_index(level=list(range(len(group_cols))), drop=True)
+        df[f"rolling_{w}day_avg"] = rolled.round(2)
+    return df
+
+
+def add_days_since_last(df: pd.DataFrame, group_cols=("time_slot",), date_col: str = "date",
+                        out_col: str = "days_since_last_operation") -> pd.DataFrame:
+    """
+    同じグループ内の前のレコードからの経過日数（先頭は NaN）。
+    グループ内の行は日付順に並んでいること。行の並びは変えない。
+    """
+    dates = pd.to_datetime(df[date_col])
+    diffs = dates.groupby([df[c] for c in group_cols], sort=False).diff()
+    df[out_col] = diffs.dt.days.astype(float)
+    return df
+
+
+class LagState:
+    """
+    追記モード用の状態: グループごとの直近 MAX_LAG 件の需要数と最終日付。
+    1日分（グループ数の行）を追加するコストは履歴の長さに依存しない。
+    """
+
+    def __init__(self, group_cols=("time_slot",), date_col: str = "date",
+                 target: str = "demand_count"):
+        self.group_cols = list(group_cols)
+        self.date_col = date_col
+        self.target = target
+        self.tails: dict = {}
+        self.last_dates: dict = {}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **kwargs) -> "LagState":
+        """既存の履歴から状態を作る（各グループの末尾 MAX_LAG 件のみ参照）"""
+        state = cls(**kwargs)
+        ordered = df.sort_values([*state.group_cols, state.date_col])
+        tail = ordered.groupby(state.group_cols, sort=False).tail(MAX_LAG)
+        for key, rows in tail.groupby(state.group_cols, sort=False):
+            key = key if len(state.group_cols) > 1 else key[0]
+            state.tails[key] = deque(rows[state.target].tolist(), maxlen=MAX_LAG)
+            state.last_dates[key] = pd.Timestamp(rows[state.date_col].iloc[-1])
+        return state
+
+    def _key(self, row) -> object:
+        if len(self.group_cols) == 1:
+            return row[self.group_cols[0]]
+        return tuple(row[c] for c in self.group_cols)
+
+    def append(self, new_rows: pd.DataFrame) -> pd.DataFrame:
+        """
+        新しい行（日付順）に特徴量を付けて返し、状態を更新する。
+        add_lag_features / add_days_since_last を全期間で計算し直した値と一致する。
+        """
+        features = {c: [] for c in [*LAG_COLUMNS, "days_since_last_operation"]}
+        for row in new_rows.sort_values(self.date_col).to_dict("records"):
+            key = self._key(row)
+            tail = self.tails.setdefault(key, deque(maxlen=MAX_LAG))
+            for k in LAGS:
+                features[f"lag_{k}_demand"].append(tail[-k] if len(tail) >= k else np.nan)
+            for w in ROLLING_WINDOWS:
+                window = list(tail)[-w:]
+                features[f"rolling_{w}day_avg"].append(
+                    float(np.round(np.mean(window), 2)) if window else np.nan
+                )
+            day = pd.Timestamp(row[self.date_col])
+            last = self.last_dates.get(key)
+            features["days_since_last_operation"].append(
+                float((day - last).days) if last is not None else np.nan
+            )
+            tail.append(row[self.target])
+            self.last_dates[key] = day
+        result = new_rows.sort_values(self.date_col).copy()
+        for column, values in features.items():
+            result[column] = values
+        return result
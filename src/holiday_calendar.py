@@ -0,0 +1,161 @@
+"""
+祝日・連休・学期などのカレンダー特徴量を、任意の期間について配列で事前計算する。
+ダミーデータ生成と実データの特徴量作成の両方から参照する。
+
+    cal = build_calendar(date(2020, 4, 1), date(2025, 3, 31))
+    cal["consecutive_holiday_count"]            # 期間全体の配列
+    cal.lookup("is_school_term", date(2024, 5, 7))  # 1日分を O(1) で参照
+
+同じ期間の計算結果はキャッシュされる。
+"""
+
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+# ─────────────────────────────────────────
+# 祝日定義（2020〜2025）
+# ─────────────────────────────────────────
+HOLIDAYS = set([
+    # 2020
+    "2020-01-01","2020-01-13","2020-02-11","2020-02-23","2020-02-24",
+    "2020-03-20","2020-04-29","2020-05-03","2020-05-04","2020-05-05",
+    "2020-05-06","2020-07-23","2020-07-24","2020-08-10","2020-09-21",
+    "2020-09-22","2020-11-03","2020-11-23",
+    # 2021
+    "2021-01-01","2021-01-11","2021-02-11","2021-02-23","2021-03-20",
+    "2021-04-29","2021-05-03","2021-05-04","2021-05-05","2021-07-22",
+    "2021-07-23","2021-08-08","2021-08-09","2021-09-20","2021-09-23",
+    "2021-11-03","2021-11-23",
+    # 2022
+    "2022-01-01","2022-01-10","2022-02-11","2022-02-23","2022-03-21",
+    "2022-04-29","2022-05-03","2022-05-04","2022-05-05","2022-07-18",
+    "2022-08-11","2022-09-19","2022-09-23","2022-10-10","2022-11-03",
+    "2022-11-23","2022-12-31",
+    # 2023
+    "2023-01-01","2023-01-02","2023-01-09","2023-02-11","2023-02-23",
+    "2023-03-21","2023-04-29","2023-05-03","2023-05-04","2023-05-05",
+    "2023-07-17","2023-08-11","2023-09-18","2023-09-23","2023-10-09",
+    "2023-11-03","2023-11-23",
+    # 2024
+    "2024-01-01","2024-01-08","2024-02-11","2024-02-12","2024-02-23",
+    "2024-03-20","2024-04-29","2024-05-03","2024-05-04","2024-05-05",
+    "2024-05-06","2024-07-15","2024-08-11","2024-08-12","2024-09-16",
+    "2024-09-22","2024-09-23","2024-10-14","2024-11-03","2024-11-04",
+    "2024-11-23",
+    # 2025
+    "2025-01-01","2025-01-13","2025-02-11","2025-02-23","2025-02-24",
+    "2025-03-20",
+])
+HOLIDAY_DATES = np.array(sorted(HOLIDAYS), dtype="datetime64[D]")
+
+# 月 → 季節（添字 = 月）
+SEASON_BY_MONTH = np.array(
+    ["", "winter", "winter", "spring", "spring", "spring", "summer",
+     "summer", "summer", "autumn", "autumn", "autumn", "winter"],
+    dtype=object,
+)
+FARMING_MONTHS = (5, 6, 9, 10)
+
+ONE_DAY = np.timedelta64(1, "D")
+
+
+def date_range(start: date, end: date) -> np.ndarray:
+    """start〜end（両端含む）の日付配列（datetime64[D]）"""
+    return np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + ONE_DAY, ONE_DAY)
+
+
+def weekday_of(dates: np.ndarray) -> np.ndarray:
+    # 0=月曜〜6=日曜（1970-01-01 は木曜）
+    return (dates.astype("int64") + 3) % 7
+
+
+def non_workday_mask(dates: np.ndarray) -> np.ndarray:
+    """土日祝なら True"""
+    return (weekday_of(dates) >= 5) | np.isin(dates, HOLIDAY_DATES)
+
+
+class CalendarTable:
+    """
+    期間内の各日のカレンダー特徴量（配列）。
+    features の各配列は dates と同じ長さで、書き換え不可。
+    """
+
+    def __init__(self, start: date, end: date):
+        self.start = start
+        self.end = end
+        self.dates = date_range(start, end)
+        self.features = _calendar_features(self.dates)
+        for values in self.features.values():
+            values.flags.writeable = False
+        self.dates.flags.writeable = False
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.features[name]
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def index(self, d: date) -> int:
+        if not self.start <= d <= self.end:
+            raise KeyError(f"{d} is outside {self.start}〜{self.end}")
+        return (d - self.start).days
+
+    def lookup(self, name: str, d: date):
+        return self.features[name][self.index(d)]
+
+
+def _calendar_features(dates: np.ndarray) -> dict:
+    """
+    日付配列に対するカレンダー系特徴量を1回の走査でまとめて計算する。
+    連休カウントは期間の前から続く連休も数えるため、直前の平日まで遡って計算する。
+    """
+    # 期間直前の連休を含めるため、平日に当たるまで開始日を遡る
+    lead = 0
+    while non_workday_mask(dates[:1] - (lead + 1) * ONE_DAY)[0]:
+        lead += 1
+    ext = np.concatenate([dates[0] - np.arange(lead, 0, -1) * ONE_DAY, dates])
+
+    non_work = non_workday_mask(ext)
+    # 連休の何日目か: 直近の平日からの経過日数（平日は0）
+    idx = np.arange(len(ext))
+    last_workday = np.maximum.accumulate(np.where(non_work, -1, idx))
+    con_hol = np.where(non_work, idx - last_workday, 0)[lead:]
+
+    month_start = dates.astype("datetime64[M]")
+    month = month_start.astype("int64") % 12 + 1
+    day = (dates - month_start.astype("datetime64[D]")).astype("int64") + 1
+    weekday = weekday_of(dates)
+    is_weekend = weekday >= 5
+
+    # 広島県の学校カレンダーに準拠した長期休暇
+    school_break = (
+        ((month == 7) & (day >= 21)) | (month == 8)                    # 夏休み
+        | ((month == 12) & (day >= 25)) | ((month == 1) & (day <= 7))  # 冬休み
+        | ((month == 3) & (day >= 25)) | ((month == 4) & (day <= 7))   # 春休み
+    )
+    return {
+        "day_of_week"              : weekday,
+        "month"                    : month,
+        "day"                      : day,
+        "is_weekend"               : is_weekend,
+        "is_holiday"               : np.isin(dates, HOLIDAY_DATES),
+        "is_non_workday"           : non_work[lead:],
+        "is_school_term"           : ~school_break & ~is_weekend,
+        "is_farming_season"        : np.isin(month, FARMING_MONTHS),
+        "is_month_boundary"        : (day <= 5) | (day >= 25),   # 月初（1〜5日）・月末（25日〜）
+        "season"                   : SEASON_BY_MONTH[month],
+        "consecutive_holiday_count": con_hol,
+    }
+
+
+@lru_cache(maxsize=32)
+def build_calendar(start: date, end: date) -> CalendarTable:
+    """期間ごとにキャッシュされたカレンダー表"""
+    return CalendarTable(start, end)
+
+
+def calendar_for(d: date) -> CalendarTable:
+    """d を含む年（前後1年を含む3年分）のカレンダー表。単日の参照用。"""
+    return build_calendar(date(d.year - 1, 1, 1), date(d.year + 1, 12, 31))
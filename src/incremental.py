@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.base_tags import base_tags_version
+from src.columnar import read_table, write_table
+from src.metrics import metrics
+from src.parallel import score_points_parallel
+from src.quantize import EMBEDDING_DTYPE
+from src.scoring import SCORE_COLUMNS, parse_tags
+from src.vector import get_encoder
+
+
+def scoring_version(ann=False):
+    # Scores depend on the base tags, the encoder used for unknown tags, the
+    # embedding storage type and the search
+    version = f"{base_tags_version()}\0{get_encoder().name}"
+    if EMBEDDING_DTYPE != "float32":
+        version += f"\0{EMBEDDING_DTYPE}"
+    if ann:
+        version += "\0ann"
+    return hashlib.sha256(version.encode("utf-8")).hexdigest()
+
+
+def fingerprints_path(output_path):
+    # Stored in the same format as the output
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.fingerprints{ext}"
+
+
+def fingerprints_stamp_path(output_path):
+    # Size and mtime of the output the fingerprints were saved with
+    return f"{os.path.splitext(output_path)[0]}.fingerprints.json"
+
+
+def _output_stamp(output_path):
+    stat = os.stat(output_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def fingerprint_points(points_df, version):
+    """Hash of each stop's id, its tags and the scoring version."""
+    fingerprints = []
+    for stop_id, tags in zip(points_df["id"], points_df["tags"]):
+        tags = json.dumps(parse_tags(tags), ensure_ascii=False)
+        key = f"{stop_id}\0{tags}\0{version}"
+        fingerprints.append(hashlib.sha256(key.encode("utf-8")).hexdigest())
+    return np.array(fingerprints, dtype=object)
+
+
+def _load_previous(output_path):
+    # Previous scores by stop id with their fingerprints, or None on a first run
+    previous_fingerprints = fingerprints_path(output_path)
+    stamp_path = fingerprints_stamp_path(output_path)
+    if not all(os.path.exists(p) for p in (output_path, previous_fingerprints, stamp_path)):
+        return None
+    with open(stamp_path) as f:
+        # The output was rewritten since (e.g. by a run without --incremental)
+        if json.load(f) != _output_stamp(output_path):
+            print("Output changed since the fingerprints were saved, rescoring every stop")
+            return None
+    # round_trip parsing gives back exactly the floats that were written
+    previous_df = read_table(
+        output_path, columns=["id", *SCORE_COLUMNS, "stop_type"], float_precision="round_trip"
+    )
+    fingerprints_df = read_table(previous_fingerprints)
+    if len(previous_df) != len(fingerprints_df):
+        return None
+    previous_df["fingerprint"] = fingerprints_df["fingerprint"].to_numpy()
+    return previous_df.drop_duplicates("id", keep="last").set_index("id")
+
+
+def incremental_scores(points_df, index_factory, output_path, workers=1, ann=False):
+    """
+    Score only new or changed stops and reuse the previous rows of
+    `output_path` for the rest. Deleted stops drop out because the result
+    follows `points_df`. `index_factory` builds the BaseTagIndex and is only
+    called when something has to be rescored; `ann` says whether it really
+    uses the approximate search (ann.ann_in_use), which is part of the
+    fingerprint.
+    Returns the scores DataFrame and the fingerprints to save with it.
+    """
+    fingerprints = fingerprint_points(points_df, scoring_version(ann))
+    previous_df = _load_previous(output_path)
+
+    changed = np.ones(len(points_df), dtype=bool)
+    if previous_df is not None:
+        previous_fingerprints = previous_df["fingerprint"].reindex(points_df["id"]).to_numpy()
+        changed = previous_fingerprints != fingerprints
+    print(f"Rescoring {int(changed.sum())} of {len(points_df)} stops")
+    metrics.count("stops_rescored", changed.sum())
+    metrics.count("stops_reused", len(points_df) - changed.sum())
+
+    values = np.empty((len(points_df), len(SCORE_COLUMNS)), dtype=np.float64)
+    stop_types = np.empty(len(points_df), dtype=object)
+    if (~changed).any():
+        reused = previous_df.loc[points_df["id"].to_numpy()[~changed]]
+        values[~changed] = reused[SCORE_COLUMNS].to_numpy(dtype=np.float64)
+        stop_types[~changed] = reused["stop_type"].astype(object).fillna("").to_numpy()
+    if changed.any():
+        changed_df = points_df.loc[changed].reset_index(drop=True)
+        rescored = score_points_parallel(changed_df, index_factory(), workers)
+        values[changed] = rescored[SCORE_COLUMNS].to_numpy()
+        stop_types[changed] = rescored["stop_type"].to_numpy()
+
+    scores_df = pd.DataFrame(values, columns=SCORE_COLUMNS)
+    scores_df["stop_type"] = stop_types
+    return scores_df, fingerprints
+
+
+def save_fingerprints(points_df, fingerprints, output_path):
+    """Save the fingerprints of the rows just written to `output_path`."""
+    write_table(
+        pd.DataFrame({"id": points_df["id"], "fingerprint": fingerprints}),
+        fingerprints_path(output_path),
+    )
+    with open(fingerprints_stamp_path(output_path), "w") as f:
+        json.dump(_output_stamp(output_path), f)
+
+
+def clear_fingerprints(output_path):
+    # Called by every other writer of `output_path`, whose rows have no fingerprints
+    for path in (fingerprints_path(output_path), fingerprints_stamp_path(output_path)):
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,118 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class Metrics:
+    """
+    Per-stage timers, counters and peak RSS of one run. Stages may nest and
+    a stage entered several times accumulates its time and calls.
+    A profiler can be attached to a single stage with set_profiler.
+    Updates and snapshots may come from several threads (e.g. the service).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc).isoformat()
+            self.stages = {}
+            self.counters = {}
+            self.profilers = {}
+
+    @contextmanager
+    def stage(self, name):
+        profiler = self.profilers.get(name)
+        start = time.perf_counter()
+        try:
+            with profiler() if profiler else nullcontext():
+                yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                stage = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+                stage["seconds"] += seconds
+                stage["calls"] += 1
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def set_profiler(self, stage, factory):
+        """
+        Run every entry of `stage` under `factory()`, a context manager
+        factory such as cprofile_to(path) or a sampling profiler's session.
+        """
+        self.profilers[stage] = factory
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                "started_at": self.started_at,
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+        snapshot["peak_rss_mb"] = peak_rss_mb()
+        return snapshot
+
+    def write(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def summary(self):
+        snapshot = self.snapshot()
+        lines = ["Run summary:"]
+        for name, stage in snapshot["stages"].items():
+            calls = f" ({stage['calls']} calls)" if stage["calls"] > 1 else ""
+            lines.append(f"  {name:<20} {stage['seconds']:9.3f} s{calls}")
+        for name, value in snapshot["counters"].items():
+            lines.append(f"  {name:<20} {value:>9}")
+        if snapshot["peak_rss_mb"] is not None:
+            lines.append(f"  {'peak_rss_mb':<20} {snapshot['peak_rss_mb']:9.1f}")
+        return "\n".join(lines)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def cprofile_to(path):
+    """
+    Profiler factory for set_profiler: cProfile over every entry of the
+    stage, with the cumulative stats dumped to `path` after each entry.
+    """
+    import cProfile
+
+    profiler = cProfile.Profile()
+
+    @contextmanager
+    def session():
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+
+    return session
+
+
+# Metrics of the current run
+metrics = Metrics()
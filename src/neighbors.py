@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+from src.scoring import SCORE_COLUMNS
+
+""" config """
+EARTH_RADIUS_KM = 6371.0088
+# Stops closer than this contribute to each other's neighborhood features
+NEIGHBOR_RADIUS_KM = 1.0
+# Scores averaged over the neighborhood (the category scores, not the demand factors)
+NEIGHBOR_SCORE_COLUMNS = [column for column in SCORE_COLUMNS if column.endswith("_score")]
+# Candidate pairs checked at a time, bounds the memory of dense areas
+MAX_CANDIDATE_PAIRS = 1 << 22
+
+
+def haversine_km(lat1, lon1, lat2, lon2, cos_lat1=None, cos_lat2=None):
+    # Great-circle distance between points given in radians (cosines may be precomputed)
+    cos_lat1 = np.cos(lat1) if cos_lat1 is None else cos_lat1
+    cos_lat2 = np.cos(lat2) if cos_lat2 is None else cos_lat2
+    a = np.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialGrid:
+    """
+    Uniform grid of `cell_km` cells over the stops, on an equirectangular
+    projection in km. Stops are sorted by cell, so every cell is one slice of
+    `order` and building the grid is one O(n log n) sort. A radius query with
+    radius <= cell_km only scans the 3 x 3 cells around each stop; candidates
+    within the radius on the projection are then checked with the haversine
+    distance.
+    """
+
+    def __init__(self, latitudes, longitudes, cell_km):
+        self.lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+        self.lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+        self.cell_km = cell_km
+        # Scaled with the largest |latitude|, projected distances never exceed
+        # the true ones, so no stop within the radius falls outside the 3 x 3 cells
+        x_scale = EARTH_RADIUS_KM * np.cos(np.abs(self.lat).max()) if len(self.lat) else 0.0
+        self.cos_lat = np.cos(self.lat)
+        self.x = self.lon * x_scale
+        self.y = self.lat * EARTH_RADIUS_KM
+        cells = np.floor(np.stack([self.x, self.y], axis=1) / cell_km).astype(np.int64)
+        if len(cells):
+            cells -= cells.min(axis=0)
+        # One key per cell, with a free row and column around the grid for the offsets
+        self.width = int(cells[:, 1].max()) + 3 if len(cells) else 3
+        self.keys = (cells[:, 0] + 1) * self.width + (cells[:, 1] + 1)
+        self.order = np.argsort(self.keys, kind="stable")
+        self.sorted_keys = self.keys[self.order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def pairs(self, radius_km):
+        """
+        Yield (i, j, distance_km) arrays of every ordered pair of different
+        stops at most `radius_km` apart, a bounded number of candidates at a time.
+        """
+        if radius_km > self.cell_km:
+            raise Exception(f"Radius {radius_km} km is larger than the grid cells ({self.cell_km} km)")
+        offsets = np.array([dx * self.width + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        neighbor_keys = self.keys[:, None] + offsets
+        starts = np.searchsorted(self.sorted_keys, neighbor_keys, side="left")
+        counts = np.searchsorted(self.sorted_keys, neighbor_keys, side="right") - starts
+        per_stop = counts.sum(axis=1)
+
+        first = 0
+        while first < len(self):
+            # As many stops as fit in MAX_CANDIDATE_PAIRS (at least one)
+            budget = np.cumsum(per_stop[first:])
+            last = first + max(1, int(np.searchsorted(budget, MAX_CANDIDATE_PAIRS, side="right")))
+            chunk_starts = starts[first:last].ravel()
+            chunk_counts = counts[first:last].ravel()
+            total = int(chunk_counts.sum())
+            i = np.repeat(np.arange(first, last), per_stop[first:last])
+            # Position of every candidate inside its cell slice of `order`
+            within = np.arange(total) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+            j = self.order[np.repeat(chunk_starts, chunk_counts) + within]
+            # The projection never overestimates, so this only drops stops out of reach
+            dx = self.x[i] - self.x[j]
+            dy = self.y[i] - self.y[j]
+            near = (dx * dx + dy * dy <= radius_km**2) & (i != j)
+            i, j = i[near], j[near]
+            distances = haversine_km(
+                self.lat[i], self.lon[i], self.lat[j], self.lon[j], self.cos_lat[i], self.cos_lat[j]
+            )
+            keep = distances <= radius_km
+            yield i[keep], j[keep], distances[keep]
+            first = last
+
+
+def neighbor_features(points_df, radius_km=NEIGHBOR_RADIUS_KM, stop_types=None):
+    """
+    Neighborhood columns of each stop, from the other stops within `radius_km`:
+
+    - neighbor_count: how many there are
+    - neighbor_<score>: their NEIGHBOR_SCORE_COLUMNS, averaged with weights
+      1 - distance / radius (NaN without neighbors that have the score)
+    - neighbor_<stop_type>_count: how many of them have each of `stop_types`
+      (default: the stop types of `points_df`)
+
+    Stops without coordinates get no neighbors and count for no one.
+    """
+    n_stops = len(points_df)
+    latitudes = points_df["latitude"].to_numpy(dtype=np.float64)
+    longitudes = points_df["longitude"].to_numpy(dtype=np.float64)
+    located = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))
+    grid = SpatialGrid(latitudes[located], longitudes[located], radius_km)
+
+    point_types = points_df["stop_type"].astype(object).fillna("").astype(str).to_numpy()
+    if stop_types is None:
+        stop_types = sorted(set(point_types) - {""})
+    type_codes = pd.Index(stop_types).get_indexer(point_types)
+    scores = points_df[NEIGHBOR_SCORE_COLUMNS].to_numpy(dtype=np.float64)
+    has_score = ~np.isnan(scores)
+    scores = np.where(has_score, scores, 0.0)
+    # Stops without tags miss every score, so the columns usually share one weight sum
+    first_column = [
+        next(m for m in range(c + 1) if np.array_equal(has_score[:, m], has_score[:, c]))
+        for c in range(has_score.shape[1])
+    ]
+    mask_columns = sorted(set(first_column))
+    score_masks = has_score[:, mask_columns]
+    mask_of_column = [mask_columns.index(m) for m in first_column]
+
+    counts = np.zeros(n_stops)
+    type_counts = np.zeros((n_stops, len(stop_types)))
+    weighted = np.zeros((n_stops, len(NEIGHBOR_SCORE_COLUMNS)))
+    mask_weights = np.zeros((n_stops, score_masks.shape[1]))
+    for i, j, distances in grid.pairs(radius_km):
+        i, j = located[i], located[j]
+        counts += np.bincount(i, minlength=n_stops)
+        typed = type_codes[j] >= 0
+        type_counts += np.bincount(
+            i[typed] * len(stop_types) + type_codes[j[typed]], minlength=n_stops * len(stop_types)
+        ).reshape(n_stops, len(stop_types))
+        w = 1.0 - distances / radius_km
+        for c in range(len(NEIGHBOR_SCORE_COLUMNS)):
+            weighted[:, c] += np.bincount(i, w * scores[j, c], minlength=n_stops)
+        for m in range(score_masks.shape[1]):
+            mask_weights[:, m] += np.bincount(i, w * score_masks[j, m], minlength=n_stops)
+
+    features = pd.DataFrame({"neighbor_count": counts.astype(np.int64)}, index=points_df.index)
+    weights = mask_weights[:, mask_of_column]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = np.where(weights > 0, weighted / weights, np.nan)
+    for c, column in enumerate(NEIGHBOR_SCORE_COLUMNS):
+        features[f"neighbor_{column}"] = averages[:, c]
+    for t, stop_type in enumerate(stop_types):
+        features[f"neighbor_{stop_type}_count"] = type_counts[:, t].astype(np.int64)
+    return features
@@ -0,0 +1,165 @@
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from src.ann import ASSIGN_BATCH_SIZE, read_ivf
+from src.quantize import QuantizedMatrix
+from src.scoring import aggregate_scores, collect_tags, resolve_tags, score_points, similar_tag_scores
+from src.similarity import query_batch_size
+
+""" config """
+# Shards per worker, so that one slow shard does not leave the others idle
+SHARDS_PER_WORKER = 4
+
+# What similar_tag_scores needs of the index, set up once per worker by _init_worker
+_worker_index = None
+
+
+def _shards(n_rows, n_shards):
+    bounds = np.linspace(0, n_rows, n_shards + 1).astype(int)
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def _shared(matrix):
+    # A memory-mapped matrix is sent as its file and mapped again by the
+    # worker, so the embeddings are never pickled and the pages are shared
+    if isinstance(matrix, np.memmap) and matrix.filename:
+        return ("npy", matrix.filename)
+    if isinstance(matrix, QuantizedMatrix):
+        return ("quantized", _shared(matrix.data), matrix.scales, matrix.norms)
+    return ("array", matrix)
+
+
+def _open_shared(spec):
+    kind, *rest = spec
+    if kind == "npy":
+        return np.load(rest[0], mmap_mode="r")
+    if kind == "quantized":
+        data, scales, norms = rest
+        return QuantizedMatrix(_open_shared(data), scales, norms)
+    return rest[0]
+
+
+def _worker_state(index):
+    # Initializer arguments: sent once per worker, not with every task
+    ann = index.ann
+    if ann is not None and ann.path is not None:
+        # Read from its file by the worker, with the nprobe in use here
+        ann = (ann.path, ann.nprobe)
+    return _shared(index.embeddings), index.norms, index.scores, index.stop_types, ann
+
+
+def _init_worker(embeddings, norms, scores, stop_types, ann):
+    global _worker_index
+    if isinstance(ann, tuple):
+        path, nprobe = ann
+        ann = read_ivf(path)
+        ann.nprobe = nprobe
+    _worker_index = SimpleNamespace(
+        embeddings=_open_shared(embeddings), norms=norms, scores=scores, stop_types=stop_types, ann=ann
+    )
+
+
+def _search_shard(tag_vectors):
+    return similar_tag_scores(tag_vectors, _worker_index)
+
+
+def _aggregate_shard(args):
+    counts, inverse, tag_vectors, tag_types = args
+    return aggregate_scores(counts, tag_vectors, tag_types, inverse)
+
+
+def _search_batch_size(index):
+    # Query rows the search handles together (see top_k_similar, IVFIndex.search)
+    if index.ann is not None:
+        return ASSIGN_BATCH_SIZE
+    return query_batch_size(len(index.norms))
+
+
+def _parallel_search(pool, index, n_shards):
+    """
+    similar_tag_scores over the pool. Shards hold whole search batches, so
+    every batch multiplies the same rows as in a serial run and the results
+    are bit-identical.
+    """
+    step = _search_batch_size(index)
+
+    def search(tag_vectors):
+        n_batches = -(-len(tag_vectors) // step)
+        chunks = [
+            tag_vectors[start * step : stop * step] for start, stop in _shards(n_batches, n_shards)
+        ]
+        results = list(pool.map(_search_shard, chunks))
+        return (
+            np.concatenate([vectors for vectors, _ in results]),
+            np.concatenate([stop_types for _, stop_types in results]),
+        )
+
+    return search
+
+
+def scoring_pool(index, workers):
+    """
+    Process pool whose workers hold the search index of `index`; pass it to
+    score_points_parallel to score many batches (e.g. chunks) without
+    starting the workers and mapping the embeddings again for each one.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=_worker_state(index)
+    )
+
+
+def score_points_parallel(points_df, index, workers, pool=None):
+    """
+    Same result as score_points, with the per-point work and the similarity
+    search spread over a process pool:
+
+    1. Workers parse the tags of contiguous shards of points.
+    2. The parent merges the distinct tags in shard order (the same
+       first-occurrence order as a serial run), looks up exact matches and
+       the resolution table, and encodes the remaining tags once.
+    3. Workers search the similar base tags of shards of those tag vectors.
+       Each worker maps base_tags.embeddings.npy itself when the pool
+       starts, so the base-tag matrix is never pickled.
+    4. Workers average the resolved contributions of their shards, each sent
+       only the rows of the tags it uses.
+
+    Shards are merged back in row order, so the output is identical to a
+    serial run. `pool` is a scoring_pool of the same index, kept open by the
+    caller; without it a pool is started for this call.
+    """
+    if workers <= 1 or len(points_df) < 2:
+        return score_points(points_df, index)
+    if pool is None:
+        with scoring_pool(index, workers) as pool:
+            return score_points_parallel(points_df, index, workers, pool)
+
+    tags_values = points_df["tags"].tolist()
+    n_shards = workers * SHARDS_PER_WORKER
+    shards = _shards(len(points_df), n_shards)
+    parsed = list(pool.map(collect_tags, [tags_values[start:stop] for start, stop in shards]))
+
+    vocabulary = {}
+    shard_rows = []
+    for shard_tags, _, _ in parsed:
+        # Row of each of the shard's tags in the merged vocabulary
+        shard_rows.append(
+            np.fromiter(
+                (vocabulary.setdefault(tag, len(vocabulary)) for tag in shard_tags),
+                dtype=np.int64,
+                count=len(shard_tags),
+            )
+        )
+    tag_vectors, tag_types = resolve_tags(
+        list(vocabulary), index, search=_parallel_search(pool, index, n_shards)
+    )
+
+    # The shard-local codes of collect_tags index the shard's own rows
+    tasks = [
+        (counts, inverse, tag_vectors[rows], tag_types[rows])
+        for (_, inverse, counts), rows in zip(parsed, shard_rows)
+    ]
+    scores = list(pool.map(_aggregate_shard, tasks))
+    return pd.concat(scores, ignore_index=True)
@@ -0,0 +1,154 @@
+import os
+
+import numpy as np
+
+""" config """
+# Storage type of the base tag matrix and the embedding cache: float32, float16 or int8
+EMBEDDING_DTYPE = os.environ.get("MOCA_EMBEDDING_DTYPE", "float32")
+DTYPES = ("float32", "float16", "int8")
+# Rows dequantized at a time by QuantizedMatrix.matmul_t
+BLOCK_ROWS = 8192
+# Guardrails, checked against float32 before a quantized matrix is used:
+# mean share of the float32 top 5 found by the quantized search ...
+MIN_NEIGHBOR_OVERLAP = 0.95
+# ... and share of queries whose weighted scores all stay within SCORE_TOLERANCE
+# (a share of each score column's range) of the float32 scores
+SCORE_TOLERANCE = 0.01
+MIN_SCORES_WITHIN = 0.95
+# dtype tag of int8 vectors in the embedding cache (float32 scale + int8 values)
+INT8_TAG = "i1+scale"
+
+
+def check_dtype(dtype):
+    if dtype not in DTYPES:
+        raise Exception(f"Unsupported embedding dtype: {dtype} (use {', '.join(DTYPES)})")
+    return dtype
+
+
+def quantize(matrix, dtype):
+    """
+    Return (data, scales) for a float32 matrix: float16 values, or int8 values
+    with one float32 scale per row (row max / 127). `scales` is None unless int8.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=-1) / 127
+        scales = np.where(scales == 0, 1, scales).astype(np.float32)
+        return np.round(matrix / scales[..., None]).astype(np.int8), scales
+    return matrix, None
+
+
+def dequantize(data, scales=None):
+    vectors = np.asarray(data, dtype=np.float32)
+    if scales is not None:
+        vectors = vectors * np.asarray(scales, dtype=np.float32)[..., None]
+    return vectors
+
+
+class QuantizedMatrix:
+    """
+    A float16 or int8 (per-row scaled) matrix, e.g. memory-mapped, that reads
+    back as float32 rows. `norms` are the row norms of the dequantized rows.
+    """
+
+    def __init__(self, data, scales=None, norms=None):
+        self.data = data
+        self.scales = scales
+        if norms is None:
+            norms = np.concatenate(
+                [
+                    np.linalg.norm(self[start : start + BLOCK_ROWS].astype(np.float64), axis=1)
+                    for start in range(0, len(data), BLOCK_ROWS)
+                ]
+            )
+            norms[norms == 0] = 1.0
+        self.norms = norms
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self):
+        # Rows come back as float32
+        return np.dtype(np.float32)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, rows):
+        scales = self.scales[rows] if self.scales is not None else None
+        return dequantize(self.data[rows], scales)
+
+    def matmul_t(self, queries):
+        """queries @ self.T in float32, dequantizing BLOCK_ROWS rows at a time."""
+        out = np.empty((len(queries), len(self.data)), dtype=np.float32)
+        for start in range(0, len(self.data), BLOCK_ROWS):
+            stop = start + BLOCK_ROWS
+            out[:, start:stop] = queries @ np.asarray(self.data[start:stop], dtype=np.float32).T
+            if self.scales is not None:
+                out[:, start:stop] *= self.scales[start:stop]
+        return out
+
+
+def storage_tag(dtype):
+    # dtype tag written next to each vector in the embedding cache
+    return INT8_TAG if dtype == "int8" else np.dtype(dtype).str
+
+
+def encode_vector(vector, dtype=EMBEDDING_DTYPE):
+    """(dtype tag, bytes) of one vector for the embedding cache."""
+    data, scale = quantize(vector, dtype)
+    if scale is not None:
+        return INT8_TAG, np.float32(scale).tobytes() + data.tobytes()
+    return storage_tag(dtype), data.tobytes()
+
+
+def decode_vector(tag, blob):
+    # Inverse of encode_vector; plain dtype tags are read as they are
+    if tag == INT8_TAG:
+        scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+    return np.frombuffer(blob, dtype=tag).astype(np.float32)
+
+
+def check_quantization(reference, reference_norms, quantized, scores, dtype, queries, k=5):
+    """
+    Compare the top-k search and the weighted scores (as in
+    scoring.similar_tag_scores) of `quantized` with the float32 `reference`.
+    The queries are also round-tripped through `dtype`, like vectors read
+    back from the embedding cache. Returns the measurements and whether they
+    meet MIN_NEIGHBOR_OVERLAP and MIN_SCORES_WITHIN. A neighbor that swaps
+    places with a near tie moves a score by a lot, so the largest error is
+    reported but only the share of queries within tolerance is checked.
+    """
+    from src.similarity import top_k_similar
+
+    def weighted(rows, similarities):
+        weights = similarities / similarities.sum(axis=1, keepdims=True)
+        return (scores[rows] * weights[:, :, None]).sum(axis=1)
+
+    exact_rows, exact_sims = top_k_similar(queries, reference, reference_norms, k)
+    stored_queries = dequantize(*quantize(queries, dtype))
+    rows, sims = top_k_similar(stored_queries, quantized, quantized.norms, k)
+
+    overlap = np.mean([len(np.intersect1d(a, b)) for a, b in zip(rows, exact_rows)]) / exact_rows.shape[1]
+    spread = scores.max(axis=0) - scores.min(axis=0)
+    spread[spread == 0] = 1.0
+    error = (np.abs(weighted(rows, sims) - weighted(exact_rows, exact_sims)) / spread).max(axis=1)
+    result = {
+        "neighbor_overlap": float(overlap),
+        "scores_within": float(np.mean(error <= SCORE_TOLERANCE)),
+        "max_score_error": float(error.max()) if error.size else 0.0,
+    }
+    result["passed"] = bool(
+        result["neighbor_overlap"] >= MIN_NEIGHBOR_OVERLAP
+        and result["scores_within"] >= MIN_SCORES_WITHIN
+    )
+    return result
@@ -0,0 +1,144 @@
+"""
+ダミーデータのモンテカルロ・レプリケート生成（モデルの分散・不確実性の評価用）。
+
+    # 需要数を レプリケート × 日 × 時間帯 の1つの配列（.npy）に保存
+    python -m src.replicates --replicates 1000 --out ./data/replicates.npy
+    # 1実現 = 1ファイル（特徴量込み、src.dummy と同じ列）でディレクトリに保存
+    python -m src.replicates --replicates 20 --out ./data/replicates --format parquet
+
+各レプリケートは SeedSequence(seed).spawn() で作った独立な乱数列を使うため、
+同じ seed・同じ番号のレプリケートはチャンクの大きさや総数に関係なく同じ実現になる。
+λ と需要数は チャンク内の レプリケート × 日 × 時間帯 の配列としてまとめて計算し、
+1チャンクの配列が CHUNK_BYTES を超えないようにレプリケート数を区切る。
+"""
+
+import argparse
+import os
+from datetime import date
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from src.columnar import write_table
+from src.dummy import (
+    END_DATE, SEED, START_DATE, TIME_SLOTS,
+    add_dummy_features, base_lambda, records_frame, simulate_weather,
+)
+from src.holiday_calendar import build_calendar
+
+""" config """
+REPLICATES_FILE = "./data/replicates.npy"
+# 1チャンクで保持する配列の上限（バイト）
+CHUNK_BYTES = 256 * 1024 * 1024
+# 1レプリケート・1日あたりの概算（気象7列 + 時間帯ごとの λ・需要数、各8バイト）
+_BYTES_PER_DAY = 8 * (7 + 2 * len(TIME_SLOTS))
+
+
+def replicate_rngs(n_replicates: int, seed: int = SEED) -> list:
+    """レプリケートごとの独立な乱数生成器（i 番目は seed と i だけで決まる）"""
+    return [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n_replicates)]
+
+
+def chunk_replicates(n_days: int, chunk_bytes: int = CHUNK_BYTES) -> int:
+    return max(1, chunk_bytes // (n_days * _BYTES_PER_DAY))
+
+
+def iter_replicates(n_replicates: int, seed: int = SEED,
+                    start: date = START_DATE, end: date = END_DATE,
+                    chunk_size: int | None = None):
+    """
+    (先頭のレプリケート番号, カレンダー, 気象, 需要数) をチャンクごとに返す。
+    気象の各配列は チャンク × 日、需要数は チャンク × 日 × 時間帯。
+    """
+    calendar = build_calendar(start, end)
+    rngs = replicate_rngs(n_replicates, seed)
+    if chunk_size is None:
+        chunk_size = chunk_replicates(len(calendar))
+
+    for first in range(0, n_replicates, chunk_size):
+        chunk_rngs = rngs[first:first + chunk_size]
+        # 乱数はレプリケートごとの列から引き、λ はチャンク全体で一括計算
+        draws = [simulate_weather(calendar["month"], rng) for rng in chunk_rngs]
+        weather = {key: np.stack([d[key] for d in draws]) for key in draws[0]}
+        lam = base_lambda(calendar, weather)
+        counts = np.stack([rng.poisson(l) for rng, l in zip(chunk_rngs, lam)])
+        yield first, calendar, weather, counts
+
+
+def write_stacked(path: str, n_replicates: int, seed: int = SEED,
+                  start: date = START_DATE, end: date = END_DATE,
+                  chunk_size: int | None = None) -> np.ndarray:
+    """
+    需要数を (レプリケート, 日, 時間帯) の int32 配列として .npy に書き出す。
+    日は start〜end の順、時間帯は TIME_SLOTS の順。ファイルはチャンクごとに
+    埋めていくため、全体がメモリに載る必要はない。戻り値は書き込んだ memmap。
+    """
+    n_days = len(build_calendar(start, end))
+    out = open_memmap(path, mode="w+", dtype=np.int32,
+                      shape=(n_replicates, n_days, len(TIME_SLOTS)))
+    for first, _, _, counts in iter_replicates(n_replicates, seed, start, end, chunk_size):
+        out[first:first + len(counts)] = counts
+        print(f"   {first + len(counts)} / {n_replicates} レプリケート")
+    out.flush()
+    return out
+
+
+def write_per_replicate(out_dir: str, n_replicates: int, seed: int = SEED,
+                        start: date = START_DATE, end: date = END_DATE,
+                        fmt: str = "csv", chunk_size: int | None = None) -> None:
+    """1実現ずつ特徴量を付けて out_dir/replicate_0000.{fmt} … に書き出す"""
+    os.makedirs(out_dir, exist_ok=True)
+    for first, calendar, weather, counts in iter_replicates(n_replicates, seed, start, end, chunk_size):
+        for j in range(len(counts)):
+            df = records_frame(calendar, {key: v[j] for key, v in weather.items()}, counts[j])
+            path = os.path.join(out_dir, f"replicate_{first + j:04d}.{fmt}")
+            write_table(add_dummy_features(df), path, encoding="utf-8-sig")
+        print(f"   {first + len(counts)} / {n_replicates} レプリケート")
+
+
+def print_summary(counts: np.ndarray) -> None:
+    totals = counts.sum(axis=(1, 2))
+    print(f"✅ 生成完了: {counts.shape[0]} レプリケート × {counts.shape[1]} 日 × {counts.shape[2]} 時間帯")
+    print(f"   ゼロ需要の割合: {(counts == 0).mean():.1%}（実データ: 78.4%）")
+    print(f"   総需要数: 平均 {totals.mean():.1f} / 標準偏差 {totals.std():.1f}")
+    slot_means = counts.mean(axis=1)
+    for k, slot in enumerate(TIME_SLOTS):
+        print(f"   {slot:8s} 平均需要数: {slot_means[:, k].mean():.3f} ± {slot_means[:, k].std():.3f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="ダミーデータのモンテカルロ・レプリケートを生成する")
+    parser.add_argument("--replicates", type=int, default=100, help="レプリケート数（既定: 100）")
+    parser.add_argument("--seed", type=int, default=SEED, help=f"親シード（既定: {SEED}）")
+    parser.add_argument(
+        "--out",
+        default=REPLICATES_FILE,
+        help=".npy なら需要数の配列、それ以外はレプリケートごとのファイルを置くディレクトリ",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("csv", "parquet", "feather"),
+        default="csv",
+        help="ディレクトリ出力時のファイル形式（既定: csv）",
+    )
+    parser.add_argument("--chunk-size", type=int, help="1チャンクのレプリケート数（既定: CHUNK_BYTES から決定）")
+    args = parser.parse_args(argv)
+    if args.replicates < 1:
+        parser.error("--replicates must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.out.endswith(".npy"):
+        counts = write_stacked(args.out, args.replicates, args.seed, chunk_size=args.chunk_size)
+        print(f"   保存先: {args.out}")
+        print_summary(counts)
+    else:
+        write_per_replicate(args.out, args.replicates, args.seed, fmt=args.format,
+                            chunk_size=args.chunk_size)
+        print(f"✅ 生成完了: {args.replicates} レプリケート → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
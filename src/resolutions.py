@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+
+from src.sqlite_store import connect, select_in
+
+""" config """
+DATA_DIR = os.path.join(os.path.dirname(__file__), "../data")
+RESOLUTIONS_FILE = os.path.join(DATA_DIR, "tag_resolutions.sqlite")
+
+
+class ResolutionTable:
+    """
+    Persistent table from a tag without an exact base-tag match to what its
+    similar base tags resolve to: the weighted score vector and stop_type.
+    Rows belong to a `version` (incremental.scoring_version: base tags,
+    encoder, embedding dtype, search) and are only read back by the same
+    version, so runs with different settings share the file without
+    clearing each other. Rows made from another `base_tags` hash (the
+    content of base_tags.csv) can never be read again and are dropped when
+    the table is opened.
+    """
+
+    def __init__(self, version, base_tags, path=None):
+        self.version = version
+        self.base_tags = base_tags
+        # Read at construction so RESOLUTIONS_FILE can be redirected (benchmarks)
+        self.path = path or RESOLUTIONS_FILE
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+
+    @property
+    def conn(self):
+        # Opened on first use, on the thread that scores
+        if self._conn is None:
+            self._conn = connect(self.path)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(resolutions)")]
+            if columns and "base_tags" not in columns:
+                # Written before rows kept their base-tag hash; derived data, start over
+                self._conn.execute("DROP TABLE resolutions")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS resolutions (version TEXT, base_tags TEXT, tag TEXT, "
+                "scores BLOB, stop_type TEXT, PRIMARY KEY (version, tag))"
+            )
+            self._conn.execute("DELETE FROM resolutions WHERE base_tags != ?", (self.base_tags,))
+        return self._conn
+
+    def get_many(self, tags):
+        """Return {tag: (score vector, stop_type)} for the tags resolved before."""
+        found = {}
+        unique_tags = list(dict.fromkeys(tags))
+        rows = select_in(
+            self.conn,
+            "SELECT tag, scores, stop_type FROM resolutions WHERE version = ? AND tag IN ({marks})",
+            unique_tags,
+            params=(self.version,),
+        )
+        for tag, blob, stop_type in rows:
+            found[tag] = (np.frombuffer(blob, dtype=np.float64), stop_type)
+        self.hits += len(found)
+        self.misses += len(unique_tags) - len(found)
+        return found
+
+    def put_many(self, tags, vectors, stop_types):
+        rows = [
+            (
+                self.version,
+                self.base_tags,
+                tag,
+                np.ascontiguousarray(vector, dtype=np.float64).tobytes(),
+                str(stop_type),
+            )
+            for tag, vector, stop_type in zip(tags, vectors, stop_types)
+        ]
+        if rows:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO resolutions (version, base_tags, tag, scores, stop_type) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
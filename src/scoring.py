@@ -0,0 +1,199 @@
+import ast
+
+import numpy as np
+import pandas as pd
+
+from src.metrics import metrics
+from src.similarity import row_norms, top_k_similar
+from src.vector import generate_vectors
+
+""" config """
+SCORE_COLUMNS = [
+    "education_score",
+    "tourism_score",
+    "welfare_score",
+    "terrain_score",
+    "transport_score",
+    "residential_score",
+    "commercial_score",
+    "base_demand_score",
+    "morning_peak_factor",
+    "evening_peak_factor",
+    "daytime_factor",
+    "weekend_factor",
+    "weather_sensitivity",
+    "seasonal_variation",
+]
+TOP_K = 5
+
+
+class BaseTagIndex:
+    """
+    Lookup structures built once from the base tags table. `embeddings` is
+    the matrix from load_base_tag_embeddings(); without it the "embedding"
+    column of `base_tags_df` is stacked into one (n_base x dim) matrix.
+    """
+
+    def __init__(self, base_tags_df, embeddings=None):
+        self.base_tags_df = base_tags_df
+        # Map each name to its first row, matching `.values[0]` on a name mask
+        self.positions = {}
+        for row, name in enumerate(base_tags_df["name"]):
+            self.positions.setdefault(name, row)
+        self.scores = base_tags_df[SCORE_COLUMNS].to_numpy(dtype=np.float64)
+        self.stop_types = base_tags_df["stop_type"].astype(str).to_numpy(dtype=object)
+        if embeddings is None:
+            embeddings = np.stack(base_tags_df["embedding"].to_numpy())
+        self.embeddings = embeddings
+        # Row norms turn one matrix multiply into cosine similarities
+        if getattr(embeddings, "norms", None) is not None:
+            # QuantizedMatrix: norms of the rows as they are read back
+            self.norms = embeddings.norms
+        elif "embedding_norm" in base_tags_df:
+            self.norms = base_tags_df["embedding_norm"].to_numpy(dtype=np.float64)
+        else:
+            self.norms = row_norms(embeddings)
+        # Optional ann.IVFIndex; without it the similarity search is exact
+        self.ann = None
+        # Optional resolutions.ResolutionTable of tags resolved by earlier runs
+        self.resolutions = None
+
+
+def load_index(ann=False):
+    """
+    The BaseTagIndex of the compiled base tags, with the IVF index when `ann`
+    is set and the resolution table of the current scoring version.
+    """
+    # Imported here: these modules import src.scoring
+    from src.ann import load_ann_index
+    from src.base_tags import base_tags_version, load_base_tag_embeddings, load_base_tags
+    from src.incremental import scoring_version
+    from src.resolutions import ResolutionTable
+
+    with metrics.stage("load_index"):
+        index = BaseTagIndex(load_base_tags(), load_base_tag_embeddings())
+        if ann:
+            index.ann = load_ann_index(index.embeddings, index.norms)
+        # Tags without an exact match resolved by earlier runs of the same version;
+        # --ann only counts when the vocabulary is large enough to use the IVF index
+        index.resolutions = ResolutionTable(
+            scoring_version(index.ann is not None), base_tags_version()
+        )
+        return index
+
+
+def parse_tags(value):
+    # Tags are stored as the string form of a Python list in the CSV
+    if isinstance(value, str):
+        return ast.literal_eval(value)
+    return list(value)
+
+
+def similar_tag_scores(tag_vectors, index):
+    """
+    Weighted average of the scores of the TOP_K most similar base tags for
+    each row of `tag_vectors`, and the stop_type of the closest one.
+    """
+    if index.ann is not None:
+        rows, similarities = index.ann.search(tag_vectors, index.embeddings, index.norms, k=TOP_K)
+    else:
+        rows, similarities = top_k_similar(tag_vectors, index.embeddings, index.norms, k=TOP_K)
+    weights = similarities / similarities.sum(axis=1, keepdims=True)
+    vectors = (index.scores[rows] * weights[:, :, None]).sum(axis=1)
+    return vectors, index.stop_types[rows[:, 0]]
+
+
+def resolve_tags(tags, index, search=None):
+    """
+    Return the score vector and stop_type that each tag contributes.
+    Exact hits are gathered from the score matrix, then tags found in the
+    index's resolution table; all other tags go through one batched
+    similarity search and are added to the table. `search` replaces
+    similar_tag_scores for that step (e.g. spread over a process pool); it
+    takes the tag vectors and returns the same two arrays.
+    """
+    rows = np.fromiter(
+        (index.positions.get(tag, -1) for tag in tags), dtype=np.int64, count=len(tags)
+    )
+    hit = rows >= 0
+    metrics.count("tags_seen", len(tags))
+    metrics.count("exact_hits", hit.sum())
+    metrics.count("fallbacks", len(tags) - hit.sum())
+    vectors = np.empty((len(tags), len(SCORE_COLUMNS)), dtype=np.float64)
+    stop_types = np.empty(len(tags), dtype=object)
+    vectors[hit] = index.scores[rows[hit]]
+    stop_types[hit] = index.stop_types[rows[hit]]
+    misses = np.flatnonzero(~hit)
+    if len(misses) and index.resolutions is not None:
+        known = index.resolutions.get_many([tags[i] for i in misses])
+        resolved = np.fromiter((tags[i] in known for i in misses), dtype=bool, count=len(misses))
+        for i in misses[resolved]:
+            vectors[i], stop_types[i] = known[tags[i]]
+        metrics.count("resolution_hits", resolved.sum())
+        misses = misses[~resolved]
+    if len(misses):
+        # Every tag that missed the exact match is encoded in one batched call
+        tag_vectors = generate_vectors([tags[i] for i in misses])
+        with metrics.stage("similarity"):
+            if search is None:
+                vectors[misses], stop_types[misses] = similar_tag_scores(tag_vectors, index)
+            else:
+                vectors[misses], stop_types[misses] = search(tag_vectors)
+        if index.resolutions is not None:
+            index.resolutions.put_many([tags[i] for i in misses], vectors[misses], stop_types[misses])
+    return vectors, stop_types
+
+
+def collect_tags(tags_values):
+    """
+    Parse the tags of each point and number the distinct tags in order of
+    first occurrence. Returns the distinct tags, the code of every tag
+    occurrence in point order, and the number of tags per point.
+    """
+    tag_lists = [parse_tags(value) for value in tags_values]
+    codes = {}
+    inverse = np.fromiter(
+        (codes.setdefault(tag, len(codes)) for tags in tag_lists for tag in tags),
+        dtype=np.int64,
+    )
+    counts = np.fromiter((len(t) for t in tag_lists), dtype=np.int64, count=len(tag_lists))
+    return list(codes), inverse, counts
+
+
+def aggregate_scores(counts, tag_vectors, tag_types, inverse):
+    """
+    Average the tag contributions of each point and pick its stop_type by
+    majority vote (ties go to the type seen first, like Counter.most_common).
+    `counts` is the number of tags of each point and `inverse` maps every tag
+    occurrence, in point order, to its row in `tag_vectors` / `tag_types`.
+    """
+    point_ids = np.repeat(np.arange(len(counts)), counts)
+
+    # np.add.at accumulates in occurrence order, same as the per-tag `+=`
+    sums = np.zeros((len(counts), tag_vectors.shape[1]), dtype=np.float64)
+    np.add.at(sums, point_ids, tag_vectors[inverse])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = sums / counts[:, None]
+
+    type_names, type_codes = np.unique(tag_types.astype(str), return_inverse=True)
+    occurrence_types = type_codes[inverse]
+    votes = np.zeros((len(counts), len(type_names)), dtype=np.int64)
+    np.add.at(votes, (point_ids, occurrence_types), 1)
+    first_seen = np.full(votes.shape, len(inverse), dtype=np.int64)
+    np.minimum.at(first_seen, (point_ids, occurrence_types), np.arange(len(inverse)))
+    stop_types = np.full(len(counts), "", dtype=object)
+    if len(type_names):
+        best = np.argmax(votes * (len(inverse) + 1) - first_seen, axis=1)
+        stop_types[counts > 0] = type_names[best[counts > 0]]
+
+    scores_df = pd.DataFrame(averages, columns=SCORE_COLUMNS)
+    scores_df["stop_type"] = stop_types
+    return scores_df
+
+
+def score_points(points_df, index):
+    """Compute the score columns and stop_type for every row of `points_df`."""
+    # Resolve each distinct tag once, then gather it for every occurrence
+    tags, inverse, counts = collect_tags(points_df["tags"])
+    tag_vectors, tag_types = resolve_tags(tags, index)
+    return aggregate_scores(counts, tag_vectors, tag_types, inverse)
@@ -0,0 +1,325 @@
+"""
+Long-running scoring service.
+
+    python -m src.service                  # http://127.0.0.1:8765
+    python -m src.service --port 9000 --ann
+
+The encoder, the base-tag matrix and the embedding cache are loaded once and
+stay warm. Stops of concurrent requests are collected for up to
+BATCH_WINDOW_MS and scored together, so a burst of requests costs one encode
+call and one similarity search. Tag lists scored before are answered from
+memory without waiting for a batch.
+
+    POST /score    {"tags": ["駅", "病院"]}
+                   {"stops": [{"id": "a", "tags": [...]}, {"id": "b", "tags": [...]}]}
+    GET  /health
+    GET  /metrics
+
+The response holds the score columns and stop_type that main.py writes to
+expanded_points.csv ("scores" for one tag list, "stops" for many, other
+keys of each stop are returned as they were sent). Restart the service to
+pick up a new base_tags.csv.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from src import vector
+from src.metrics import metrics
+from src.scoring import load_index, score_points
+
+""" config """
+HOST = "127.0.0.1"
+PORT = 8765
+# Requests arriving this soon after the first one of a batch join it
+BATCH_WINDOW_MS = 2.0
+# A batch is scored as soon as it holds this many stops
+MAX_BATCH_STOPS = 4096
+# Scores kept for tag lists already seen (least recently used are dropped)
+RESULT_CACHE_SIZE = 100_000
+# Largest request body accepted
+MAX_BODY_BYTES = 16 * 1024 * 1024
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def score_tag_lists(tag_lists, index):
+    """Score columns and stop_type of each tag list, as in expanded_points.csv."""
+    scores_df = score_points(pd.DataFrame({"tags": pd.Series(tag_lists, dtype=object)}), index)
+    records = scores_df.to_dict("records")
+    # Stops without tags have NaN scores, which JSON has no literal for
+    for record in records:
+        for key, value in record.items():
+            if isinstance(value, float) and math.isnan(value):
+                record[key] = None
+    return records
+
+
+def check_tags(tags):
+    if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+        raise RequestError(400, "tags must be a list of strings")
+    return tags
+
+
+class MicroBatcher:
+    """
+    Queue of pending requests, drained by run(). The first request of a
+    batch waits at most `window` seconds for others; the whole batch is then
+    scored in one score_points call on the single scoring thread, which also
+    owns the embedding cache's SQLite connection. The index does not change
+    while serving, so the scores of each distinct tag list are kept in an LRU.
+    """
+
+    def __init__(
+        self,
+        index,
+        executor,
+        window=BATCH_WINDOW_MS / 1000,
+        max_stops=MAX_BATCH_STOPS,
+        cache_size=RESULT_CACHE_SIZE,
+    ):
+        self.index = index
+        self.executor = executor
+        self.window = window
+        self.max_stops = max_stops
+        self.cache_size = cache_size
+        self.results = OrderedDict()
+        self.queue = asyncio.Queue()
+
+    async def score(self, tag_lists):
+        """Score records of each tag list, in order; only unseen lists are batched."""
+        keys = [tuple(tags) for tags in tag_lists]
+        found = {}
+        for key in keys:
+            if key in self.results:
+                self.results.move_to_end(key)
+                found[key] = self.results[key]
+        metrics.count("result_cache_hits", sum(key in found for key in keys))
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            future = asyncio.get_running_loop().create_future()
+            await self.queue.put((missing, future))
+            for key, record in zip(missing, await future):
+                found[key] = record
+                self._remember(key, record)
+        # Copies, so callers can add their own keys
+        return [dict(found[key]) for key in keys]
+
+    def _remember(self, key, record):
+        self.results[key] = record
+        self.results.move_to_end(key)
+        while len(self.results) > self.cache_size:
+            self.results.popitem(last=False)
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        n_stops = len(batch[0][0])
+        deadline = loop.time() + self.window
+        while n_stops < self.max_stops:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except TimeoutError:
+                break
+            batch.append(item)
+            n_stops += len(item[0])
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            tag_lists = [tags for lists, _ in batch for tags in lists]
+            metrics.count("batches")
+            metrics.count("stops_scored", len(tag_lists))
+            try:
+                records = await loop.run_in_executor(self.executor, self._score, tag_lists)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            offset = 0
+            for lists, future in batch:
+                # A client that went away has its future cancelled
+                if not future.done():
+                    future.set_result(records[offset : offset + len(lists)])
+                offset += len(lists)
+
+    def _score(self, tag_lists):
+        with metrics.stage("batch"):
+            return score_tag_lists(tag_lists, self.index)
+
+
+class ScoringService:
+    def __init__(self, ann=False, window=BATCH_WINDOW_MS / 1000, max_stops=MAX_BATCH_STOPS):
+        self.ann = ann
+        self.window = window
+        self.max_stops = max_stops
+        # Every scoring call runs on this thread, see MicroBatcher
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scoring")
+        self.batcher = None
+        self._batch_task = None
+
+    def _warm_up(self):
+        index = load_index(self.ann)
+        # Loads the model now instead of on the first unknown tag
+        getattr(vector.get_encoder(), "model", None)
+        return index
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        index = await loop.run_in_executor(self.executor, self._warm_up)
+        self.batcher = MicroBatcher(index, self.executor, self.window, self.max_stops)
+        self._batch_task = asyncio.create_task(self.batcher.run())
+        return index
+
+    async def stop(self):
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+        # The stores were opened on the scoring thread and have to be closed there
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._close_stores)
+        self.executor.shutdown(wait=True)
+
+    def _close_stores(self):
+        vector.embedding_cache.close()
+        if self.batcher is not None and self.batcher.index.resolutions is not None:
+            self.batcher.index.resolutions.close()
+
+    async def dispatch(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "base_tags": len(self.batcher.index.scores)}
+        if method == "GET" and path == "/metrics":
+            return 200, metrics.snapshot()
+        if path != "/score":
+            raise RequestError(404, f"Unknown endpoint: {method} {path}")
+        if method != "POST":
+            raise RequestError(400, "Use POST /score")
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            raise RequestError(400, f"Invalid JSON: {e}")
+        metrics.count("requests")
+        if isinstance(payload, dict) and "tags" in payload:
+            records = await self.batcher.score([check_tags(payload["tags"])])
+            return 200, {"scores": records[0]}
+        if isinstance(payload, dict) and isinstance(payload.get("stops"), list):
+            stops = payload["stops"]
+            if not all(isinstance(stop, dict) for stop in stops):
+                raise RequestError(400, "stops must be a list of objects with tags")
+            records = await self.batcher.score([check_tags(stop.get("tags")) for stop in stops])
+            return 200, {"stops": [{**stop, **record} for stop, record in zip(stops, records)]}
+        raise RequestError(400, 'Send {"tags": [...]} or {"stops": [{"tags": [...]}, ...]}')
+
+    async def handle(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive, enough for local clients
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY_BYTES:
+                        raise RequestError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+                    body = await reader.readexactly(length)
+                    status, payload = await self.dispatch(method, path, body)
+                except RequestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except ValueError as e:
+                    status, payload = 400, {"error": f"Malformed request: {e}"}
+                except asyncio.IncompleteReadError:
+                    break
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                close = headers.get("connection", "").lower() == "close" or status == 413
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    "Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode("latin-1")
+                    + data
+                )
+                await writer.drain()
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT, ready=None):
+        """Serve until cancelled; `ready` (a callback) gets the bound port."""
+        index = await self.start()
+        server = await asyncio.start_server(self.handle, host, port)
+        bound_port = server.sockets[0].getsockname()[1]
+        print(f"Scoring service on http://{host}:{bound_port} ({len(index.scores)} base tags)")
+        if ready is not None:
+            ready(bound_port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve stop scores over HTTP with warm caches.")
+    parser.add_argument("--host", default=HOST, help=f"address to listen on (default: {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"port to listen on (default: {PORT})")
+    parser.add_argument(
+        "--ann",
+        action="store_true",
+        help="search similar base tags with the approximate IVF index (large vocabularies)",
+    )
+    parser.add_argument(
+        "--window-ms",
+        type=float,
+        default=BATCH_WINDOW_MS,
+        help=f"how long a request waits for others to batch with (default: {BATCH_WINDOW_MS})",
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=MAX_BATCH_STOPS,
+        help=f"stops scored in one batch at most (default: {MAX_BATCH_STOPS})",
+    )
+    args = parser.parse_args(argv)
+    if args.window_ms < 0:
+        parser.error("--window-ms must not be negative")
+    if args.max_batch < 1:
+        parser.error("--max-batch must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    service = ScoringService(args.ann, args.window_ms / 1000, args.max_batch)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import numpy as np
+
+from src.quantize import QuantizedMatrix
+
+""" config """
+# Number of query rows multiplied against the base matrix at once
+QUERY_BATCH_SIZE = 4096
+# ... fewer with a large base, so one batch holds at most this many similarities
+MAX_BATCH_SIMILARITIES = 1 << 24
+
+
+def normalize_rows(matrix):
+    # L2-normalize each row; zero rows stay zero like sklearn's normalize
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def row_norms(matrix):
+    # Row L2 norms in float64; zero rows get 1 so they stay zero
+    norms = np.linalg.norm(np.asarray(matrix, dtype=np.float64), axis=1)
+    norms[norms == 0] = 1.0
+    return norms
+
+
+def sample_queries(base, base_norms, n_queries, noise, seed=0):
+    """
+    Check queries for approximate searches: up to `n_queries` random base
+    rows as unit vectors, each moved by a random vector of length `noise`.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(base_norms), min(len(base_norms), n_queries), replace=False))
+    unit = np.asarray(base[rows], dtype=np.float64) / base_norms[rows][:, None]
+    return unit + noise * normalize_rows(rng.standard_normal(unit.shape))
+
+
+def query_batch_size(n_base):
+    # Query rows searched together against a base of `n_base` rows
+    return max(1, min(QUERY_BATCH_SIZE, MAX_BATCH_SIMILARITIES // max(1, n_base)))
+
+
+def top_k_similar(queries, base, base_norms, k=5):
+    """
+    Return the row indices and cosine similarities of the `k` rows of `base`
+    most similar to each query, best first. `base_norms` holds the row norms
+    of `base`, so one matrix multiply gives every cosine similarity.
+    The multiply runs in the dtype of `base`, so a float32 memory-mapped
+    matrix is never copied (a QuantizedMatrix is dequantized block by block);
+    the k winners are then rescored in float64.
+    """
+    queries = normalize_rows(np.atleast_2d(queries))
+    search_queries = queries.astype(base.dtype, copy=False)
+    k = min(k, base.shape[0])
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    similarities = np.empty((len(queries), k), dtype=np.float64)
+    batch_size = query_batch_size(base.shape[0])
+    for start in range(0, len(queries), batch_size):
+        stop = start + batch_size
+        if isinstance(base, QuantizedMatrix):
+            sims = base.matmul_t(search_queries[start:stop]) / base_norms
+        else:
+            sims = (search_queries[start:stop] @ base.T) / base_norms
+        # Unordered top k per row, then sort only those k columns
+        candidates = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        candidate_rows = np.asarray(base[candidates.ravel()], dtype=np.float64)
+        candidate_rows /= base_norms[candidates.ravel()][:, None]
+        candidate_sims = np.einsum(
+            "nkd,nd->nk", candidate_rows.reshape(*candidates.shape, -1), queries[start:stop]
+        )
+        # Ties keep the lower row first, like Series.nlargest
+        order = np.lexsort((candidates, -candidate_sims), axis=-1)
+        indices[start:stop] = np.take_along_axis(candidates, order, axis=1)
+        similarities[start:stop] = np.take_along_axis(candidate_sims, order, axis=1)
+    return indices, similarities
@@ -0,0 +1,32 @@
+import os
+import sqlite3
+
+""" config """
+# Keys bound per IN (...) query, well below SQLite's bound-parameter limit
+IN_BATCH_SIZE = 500
+
+
+def connect(path):
+    """
+    Connection to the SQLite file at `path` (its directory is created) in
+    autocommit mode, with WAL so readers in other processes never block the
+    writer, and synchronous=NORMAL since the stores only hold derived data.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def select_in(conn, sql, keys, params=()):
+    """
+    All rows of `sql` for `keys`, queried IN_BATCH_SIZE keys at a time. The
+    "{marks}" in `sql` becomes the placeholders of one batch, bound after `params`.
+    """
+    rows = []
+    for start in range(0, len(keys), IN_BATCH_SIZE):
+        batch = keys[start : start + IN_BATCH_SIZE]
+        marks = ",".join("?" * len(batch))
+        rows.extend(conn.execute(sql.format(marks=marks), [*params, *batch]).fetchall())
+    return rows
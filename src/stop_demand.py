@@ -0,0 +1,188 @@
+"""
+停留所ごとの需要数ダミーデータ生成（停留所 × 日 × 時間帯）。
+
+main.py の出力（expanded_points.csv）の停留所ごとの係数で、src/dummy.py の λ を
+停留所単位に補正する。気象は1日1回だけ引き、全停留所で共有する。
+
+    python -m src.stop_demand
+    python -m src.stop_demand --points ./data/expanded_points.parquet --format parquet
+
+出力（--out のディレクトリ）:
+  days.{fmt}        : 1日1行のカレンダー・気象特徴量（全停留所共通）
+  part-00000.{fmt}… : stop_id, stop_type, date, time_slot, demand_count
+                      （STOPS_PER_PART 停留所ずつ、停留所 → 日付 → 時間帯 の順）
+
+停留所はパートごとに配列で計算して書き出すため、1万停留所 × 5年 × 3時間帯
+（約5,500万行）でもメモリに載るのは1パート分だけ。各パートは停留所の全期間を
+含むので、ラグ特徴量は src/features.py の add_lag_features(
+group_cols=["stop_id", "time_slot"]) でパートごとに計算できる。
+"""
+
+import argparse
+import os
+import shutil
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from src.columnar import read_table, write_table
+from src.dummy import (
+    _MONTHLY_COEF, END_DATE, SEED, START_DATE, TIME_SLOTS,
+    calendar_lambda, day_columns, simulate_weather, weather_factor,
+)
+from src.holiday_calendar import build_calendar
+
+""" config """
+POINTS_FILE = "./data/expanded_points.csv"
+STOP_DEMAND_DIR = "./data/stop_demand"
+STOPS_PER_PART = 500
+# この base_demand_score の停留所が src/dummy.py の集計系列と同じ需要水準になる
+BASE_DEMAND_REF = 50.0
+# この weather_sensitivity の停留所が src/dummy.py と同じ気象補正を受ける
+WEATHER_SENSITIVITY_REF = 0.2
+
+# 時間帯（TIME_SLOTS の順）ごとの停留所係数
+SLOT_FACTOR_COLUMNS = {
+    "morning": "morning_peak_factor",
+    "daytime": "daytime_factor",
+    "evening": "evening_peak_factor",
+}
+FACTOR_COLUMNS = [
+    "base_demand_score", *SLOT_FACTOR_COLUMNS.values(),
+    "weekend_factor", "weather_sensitivity", "seasonal_variation",
+]
+# スコアが欠けている停留所に使う値（需要なし・補正なし）
+NEUTRAL_FACTORS = {
+    "base_demand_score": 0.0,
+    "morning_peak_factor": 1.0,
+    "daytime_factor": 1.0,
+    "evening_peak_factor": 1.0,
+    "weekend_factor": 1.0,
+    "weather_sensitivity": WEATHER_SENSITIVITY_REF,
+    "seasonal_variation": 1.0,
+}
+
+
+def load_stops(path: str = POINTS_FILE) -> pd.DataFrame:
+    """停留所 id・種別と需要係数（欠損は NEUTRAL_FACTORS で補完）"""
+    stops = read_table(path, columns=["id", "stop_type", *FACTOR_COLUMNS])
+    stops[FACTOR_COLUMNS] = stops[FACTOR_COLUMNS].fillna(NEUTRAL_FACTORS)
+    stops["stop_type"] = stops["stop_type"].astype(object).fillna("")
+    return stops.reset_index(drop=True)
+
+
+def stop_lambda(stops: pd.DataFrame, calendar, weather: dict) -> np.ndarray:
+    """
+    停留所 × 日 × 時間帯 の λ。
+      規模    : base_demand_score / BASE_DEMAND_REF
+      時間帯  : morning_peak_factor / daytime_factor / evening_peak_factor
+      週末祝日: weekend_factor
+      季節    : 月別係数の 1 からの振れ幅を seasonal_variation 倍
+      気象    : 気象補正係数を weather_sensitivity / WEATHER_SENSITIVITY_REF 乗
+    """
+    stop = lambda column: stops[column].to_numpy(dtype=np.float64)[:, None, None]
+    day = lambda x: np.asarray(x)[None, :, None]
+
+    scale = np.maximum(stop("base_demand_score"), 0.0) / BASE_DEMAND_REF
+    slots = np.stack(
+        [stops[SLOT_FACTOR_COLUMNS[s]].to_numpy(dtype=np.float64) for s in TIME_SLOTS], axis=1
+    )[:, None, :]
+    off = day(calendar["is_weekend"] | calendar["is_holiday"])
+    weekend = np.where(off, stop("weekend_factor"), 1.0)
+
+    coef = day(_MONTHLY_COEF[calendar["month"]])
+    season = (1.0 + stop("seasonal_variation") * (coef - 1.0)) / coef
+
+    exponent = np.maximum(stop("weather_sensitivity"), 0.0) / WEATHER_SENSITIVITY_REF
+    weather_adj = day(weather_factor(weather)) ** exponent
+
+    lam = calendar_lambda(calendar)[None] * scale * np.maximum(slots, 0.0) * weekend
+    return np.maximum(lam * np.maximum(season, 0.0) * weather_adj, 0.0)
+
+
+def part_frame(stops: pd.DataFrame, dates: np.ndarray, counts: np.ndarray) -> pd.DataFrame:
+    """1パート分（counts は 停留所 × 日 × 時間帯）を 停留所 → 日付 → 時間帯 の行にする"""
+    n_stops, n_days, n_slots = counts.shape
+    return pd.DataFrame({
+        "stop_id"     : np.repeat(stops["id"].to_numpy(dtype=object), n_days * n_slots),
+        "stop_type"   : np.repeat(stops["stop_type"].to_numpy(dtype=object), n_days * n_slots),
+        "date"        : np.tile(np.repeat(dates, n_slots), n_stops),
+        "time_slot"   : np.tile(np.array(TIME_SLOTS, dtype=object), n_stops * n_days),
+        "demand_count": counts.ravel(),
+    })
+
+
+def generate_stop_demand(stops: pd.DataFrame, out_dir: str = STOP_DEMAND_DIR,
+                         start: date = START_DATE, end: date = END_DATE,
+                         seed: int = SEED, fmt: str = "csv",
+                         stops_per_part: int = STOPS_PER_PART) -> int:
+    """
+    days.{fmt} と part-NNNNN.{fmt} を out_dir に書き出し、総行数を返す。
+    同じ seed・同じ stops_per_part なら同じデータになる。
+    {out_dir}.tmp に書いてから out_dir と入れ替えるので、前回の実行のパートや
+    途中で止まった実行の書きかけは残らない。
+    """
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    weather_seq, counts_seq = np.random.SeedSequence(seed).spawn(2)
+
+    calendar = build_calendar(start, end)
+    weather = simulate_weather(calendar["month"], np.random.default_rng(weather_seq))
+    days = day_columns(calendar, weather)
+    write_table(pd.DataFrame(days), os.path.join(tmp_dir, f"days.{fmt}"), encoding="utf-8-sig")
+
+    n_parts = -(-len(stops) // stops_per_part)
+    rows = 0
+    for part, part_seq in enumerate(counts_seq.spawn(n_parts)):
+        part_stops = stops.iloc[part * stops_per_part:(part + 1) * stops_per_part]
+        lam = stop_lambda(part_stops, calendar, weather)
+        counts = np.random.default_rng(part_seq).poisson(lam)
+        write_table(
+            part_frame(part_stops, days["date"], counts),
+            os.path.join(tmp_dir, f"part-{part:05d}.{fmt}"),
+            encoding="utf-8-sig",
+        )
+        rows += counts.size
+        print(f"   パート {part + 1} / {n_parts}（{rows} 行）")
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="停留所ごとの需要数ダミーデータを生成する")
+    parser.add_argument("--points", default=POINTS_FILE, help=f"停留所の係数（既定: {POINTS_FILE}）")
+    parser.add_argument("--out", default=STOP_DEMAND_DIR, help=f"出力ディレクトリ（既定: {STOP_DEMAND_DIR}）")
+    parser.add_argument(
+        "--format",
+        choices=("csv", "parquet", "feather"),
+        default="csv",
+        help="出力ファイルの形式（既定: csv）",
+    )
+    parser.add_argument("--seed", type=int, default=SEED, help=f"シード（既定: {SEED}）")
+    parser.add_argument(
+        "--stops-per-part",
+        type=int,
+        default=STOPS_PER_PART,
+        help=f"1パートの停留所数（既定: {STOPS_PER_PART}）",
+    )
+    args = parser.parse_args(argv)
+    if args.stops_per_part < 1:
+        parser.error("--stops-per-part must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stops = load_stops(args.points)
+    rows = generate_stop_demand(
+        stops, args.out, seed=args.seed, fmt=args.format, stops_per_part=args.stops_per_part
+    )
+    print(f"✅ 生成完了: {len(stops)} 停留所, {rows} レコード → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import json
+import os
+from contextlib import nullcontext
+
+import pandas as pd
+
+from src.data_fetch import ensure_cache, iter_data
+from src.incremental import clear_fingerprints, scoring_version
+from src.metrics import metrics
+from src.parallel import score_points_parallel, scoring_pool
+
+
+def progress_path(output_path):
+    return f"{output_path}.progress.json"
+
+
+def partial_path(output_path):
+    return f"{output_path}.partial"
+
+
+def _source_signature(chunk_size, index):
+    # A resume is only valid for the same points file, chunking and scoring
+    # (base tags, encoder, embedding dtype, search), so no output mixes two
+    stat = os.stat(ensure_cache())
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "chunk_size": chunk_size,
+        "scoring_version": scoring_version(index.ann is not None),
+    }
+
+
+def _load_progress(output_path, signature):
+    path = progress_path(output_path)
+    if not (os.path.exists(path) and os.path.exists(partial_path(output_path))):
+        return None
+    with open(path) as f:
+        progress = json.load(f)
+    if progress.get("source") != signature:
+        return None
+    return progress
+
+
+def _save_progress(output_path, progress):
+    path = progress_path(output_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
+
+
+def stream_scores(index, output_path, chunk_size, workers=1):
+    """
+    Score the points file `chunk_size` rows at a time and append each chunk
+    to `output_path`, so memory stays bounded by one chunk. Rows go to a
+    `.partial` file that replaces the output only at the end. A progress
+    file records the completed chunks, so a failed run resumes from the
+    last completed chunk.
+    """
+    signature = _source_signature(chunk_size, index)
+    progress = _load_progress(output_path, signature)
+    if progress is None:
+        progress = {"source": signature, "chunks_done": 0, "rows_done": 0, "bytes": 0}
+    else:
+        print(f"Resuming after chunk {progress['chunks_done']}")
+
+    # One pool for every chunk, so the workers set up their search index once
+    pool = scoring_pool(index, workers) if workers > 1 else None
+    with pool or nullcontext(), open(partial_path(output_path), "a+b") as f:
+        # Drop anything written after the last recorded chunk
+        f.truncate(progress["bytes"])
+        f.seek(progress["bytes"])
+        for chunk in iter_data(chunk_size, skip_chunks=progress["chunks_done"]):
+            with metrics.stage("score"):
+                scores_df = score_points_parallel(chunk, index, workers, pool)
+            chunk = pd.concat([chunk, scores_df], axis=1)
+            with metrics.stage("write"):
+                f.write(chunk.to_csv(index=False, header=progress["bytes"] == 0).encode("utf-8"))
+                f.flush()
+                os.fsync(f.fileno())
+            metrics.count("rows_written", len(chunk))
+            progress["chunks_done"] += 1
+            progress["rows_done"] += len(chunk)
+            progress["bytes"] = f.tell()
+            _save_progress(output_path, progress)
+
+    os.replace(partial_path(output_path), output_path)
+    os.remove(progress_path(output_path))
+    # The rows were not fingerprinted, an --incremental run must rescore them
+    clear_fingerprints(output_path)
+    return progress["rows_done"]
@@ -0,0 +1,332 @@
+"""
+学習用の需要データローダー（ダミー・停留所別データ → memmap の数値特徴量行列）。
+
+    # 一度だけコンパイル（入力が変わったときだけ作り直す）
+    python -m src.training_data --source ./data/dummy.csv
+    python -m src.training_data --source ./data/stop_demand --out ./data/training/stop_demand
+
+    # 学習ジョブ側
+    data = load_training_data("./data/dummy.csv")
+    train, valid = data.split("2024-04-01")
+    for X, y in train.batches(1024, shuffle=True, seed=0):
+        ...
+
+出力（--out のディレクトリ）:
+  features.npy : float32（行 × 特徴量）。文字列の列（time_slot, season,
+                 weather_label, stop_type, stop_id）はカテゴリ番号、欠損は NaN
+  target.npy   : float32 の demand_count
+  dates.npy    : datetime64[D] の日付（分割用、特徴量には含めない）
+行は日付順（停留所別データは 日付 → 停留所 → 時間帯 の順）に並べるため、
+日付での分割は連続した行の範囲になり、ミニバッチは行列のビューになる。
+  schema.json  : 特徴量の列名・カテゴリ辞書（番号 → 値）・入力ファイルの署名
+
+配列は読み取り専用の memmap で開くため、同じ行列を読む複数の学習プロセスは
+OS のページキャッシュ上の1つのコピーを共有する。TrainingData は pickle
+（DataLoader のワーカーなど）で渡すとパスだけを送り、受け取った側で開き直す。
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+from src.columnar import FORMATS, read_table
+from src.dummy import DUMMY_FILE, TIME_SLOTS
+from src.features import add_days_since_last, add_lag_features
+
+""" config """
+TRAINING_DIR = "./data/training"
+TARGET = "demand_count"
+DATE_COLUMN = "date"
+BATCH_SIZE = 1024
+# 既知の値は固定の番号にする（それ以外は出現順に番号を振る）
+KNOWN_CATEGORIES = {"time_slot": TIME_SLOTS}
+
+
+def _source_files(source: str) -> list:
+    """入力ファイルの一覧（ファイル1つ、または days + part-* のディレクトリ）"""
+    if os.path.isfile(source):
+        return [source]
+    days = [path for path in glob.glob(os.path.join(source, "days.*"))
+            if os.path.splitext(path)[1] in FORMATS]
+    parts = sorted(path for path in glob.glob(os.path.join(source, "part-*"))
+                   if os.path.splitext(path)[1] in FORMATS and ".tmp." not in path)
+    if len(days) != 1 or not parts:
+        raise Exception(f"No dummy table or stop demand directory at {source}")
+    return days + parts
+
+
+def source_signature(source: str) -> list:
+    # 入力が変わったかどうかの判定用（名前・サイズ・更新時刻）
+    return [[os.path.basename(path), os.path.getsize(path), os.stat(path).st_mtime_ns]
+            for path in _source_files(source)]
+
+
+def _blocks(source: str):
+    """
+    特徴量付きの DataFrame をブロック単位で返す。
+      ファイル      : src.dummy の出力（ラグ特徴量込み）をそのまま1ブロック
+      ディレクトリ  : src.stop_demand の出力。パートごとに days を結合し、
+                      停留所 × 時間帯 単位でラグ・経過日数特徴量を付ける
+                      （src.dummy と同じく lag_7 が無い先頭の行は除く）
+    """
+    files = _source_files(source)
+    # CSV は BOM 付き（utf-8-sig）で書かれている
+    if len(files) == 1:
+        yield read_table(files[0], encoding="utf-8-sig")
+        return
+    days = read_table(files[0], encoding="utf-8-sig")
+    for path in files[1:]:
+        df = read_table(path, encoding="utf-8-sig").merge(days, on=DATE_COLUMN, how="left")
+        df = add_lag_features(df, group_cols=["stop_id", "time_slot"])
+        df = df.dropna(subset=["lag_7_demand"])
+        df = df.sort_values(["stop_id", DATE_COLUMN, "time_slot"]).reset_index(drop=True)
+        yield add_days_since_last(df, group_cols=["stop_id", "time_slot"])
+
+
+def _encode(df: pd.DataFrame, features: list, categories: dict) -> np.ndarray:
+    """ブロックを float32 行列にする。カテゴリ辞書には新しい値を追記する"""
+    X = np.empty((len(df), len(features)), dtype=np.float32)
+    for j, column in enumerate(features):
+        values = df[column]
+        if column in categories:
+            values = values.astype(object).where(values.notna(), "").astype(str)
+            known = categories[column]
+            seen = set(known)
+            known.extend(value for value in pd.unique(values) if value not in seen)
+            X[:, j] = pd.Index(known).get_indexer(values)
+        else:
+            X[:, j] = values.to_numpy(dtype=np.float32, na_value=np.nan)
+    return X
+
+
+def _place(out: np.ndarray, values: np.ndarray, first_stop: int, shape: tuple | None) -> None:
+    """
+    停留所 → 日付 → 時間帯 の順のブロックを 日付 → 停留所 → 時間帯 の順の
+    out に書き込む。shape は (日数, 停留所数, 時間帯数)、None なら out は1ブロック。
+    """
+    if shape is None:
+        out[:] = values
+        return
+    n_days, n_stops, n_slots = shape
+    grid = out.reshape(n_days, n_stops, n_slots, *out.shape[1:])
+    block = values.reshape(-1, n_days, n_slots, *values.shape[1:])
+    grid[:, first_stop:first_stop + len(block)] = block.swapaxes(0, 1)
+
+
+def compile_training_data(source: str = DUMMY_FILE, out_dir: str | None = None,
+                          force: bool = False) -> str:
+    """
+    source を out_dir に memmap 用の配列としてコンパイルし、out_dir を返す。
+    schema.json の入力署名が一致すれば何もしない。ブロックはいったん一時
+    ディレクトリに書き、総行数が分かってから日付順の1つの行列にまとめる。
+    """
+    out_dir = out_dir or default_out_dir(source)
+    signature = source_signature(source)
+    schema_path = os.path.join(out_dir, "schema.json")
+    if not force and os.path.exists(schema_path):
+        with open(schema_path, encoding="utf-8") as f:
+            if json.load(f).get("source_signature") == signature:
+                return out_dir
+
+    tmp_dir = f"{out_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    features, categories, rows = None, None, 0
+    # ブロックごとの停留所数（停留所別データのみ）と、各停留所の日数・時間帯数
+    block_stops, grid = [], set()
+    # 別のパートにも同じ停留所があれば（古いパートの混入など）重複して数えてしまう
+    seen_stops = set()
+    for i, df in enumerate(_blocks(source)):
+        if features is None:
+            features = [c for c in df.columns if c not in (DATE_COLUMN, TARGET)]
+            categories = {c: list(KNOWN_CATEGORIES.get(c, [])) for c in features
+                          if not pd.api.types.is_numeric_dtype(df[c])}
+        block = os.path.join(tmp_dir, f"block-{i:05d}")
+        np.save(f"{block}.features.npy", _encode(df, features, categories))
+        np.save(f"{block}.target.npy", df[TARGET].to_numpy(dtype=np.float32))
+        np.save(f"{block}.dates.npy", pd.to_datetime(df[DATE_COLUMN]).to_numpy().astype("datetime64[D]"))
+        if "stop_id" in df:
+            stops = set(df["stop_id"].unique())
+            if not seen_stops.isdisjoint(stops):
+                raise Exception(f"Stops in block {i} also appear in an earlier block: "
+                                f"{sorted(seen_stops & stops)[:5]}")
+            seen_stops |= stops
+            block_stops.append(len(stops))
+            grid.add((df[DATE_COLUMN].nunique(), df["time_slot"].nunique()))
+            if len(df) != block_stops[-1] * df[DATE_COLUMN].nunique() * df["time_slot"].nunique():
+                raise Exception(f"Stops in block {i} do not all cover the same dates and time slots")
+        rows += len(df)
+        print(f"   ブロック {i + 1}（{rows} 行）")
+    if len(grid) > 1:
+        raise Exception(f"Blocks cover different dates or time slots: {sorted(grid)}")
+    n_blocks = i + 1
+    shape = None
+    if grid:
+        n_days, n_slots = grid.pop()
+        shape = (n_days, sum(block_stops), n_slots)
+
+    outputs = {
+        "features": open_memmap(os.path.join(tmp_dir, "features.npy"), mode="w+",
+                                dtype=np.float32, shape=(rows, len(features))),
+        "target": open_memmap(os.path.join(tmp_dir, "target.npy"), mode="w+",
+                              dtype=np.float32, shape=(rows,)),
+        "dates": open_memmap(os.path.join(tmp_dir, "dates.npy"), mode="w+",
+                             dtype="datetime64[D]", shape=(rows,)),
+    }
+    for i in range(n_blocks):
+        block = os.path.join(tmp_dir, f"block-{i:05d}")
+        for name, out in outputs.items():
+            _place(out, np.load(f"{block}.{name}.npy"), sum(block_stops[:i]), shape)
+            os.remove(f"{block}.{name}.npy")
+    if np.any(np.diff(outputs["dates"]) < np.timedelta64(0, "D")):
+        raise Exception(f"Rows of {source} are not in date order")
+    for out in outputs.values():
+        out.flush()
+    del outputs
+
+    schema = {
+        "source": os.path.abspath(source),
+        "source_signature": signature,
+        "rows": rows,
+        "target": TARGET,
+        "features": features,
+        "categories": categories,
+    }
+    with open(os.path.join(tmp_dir, "schema.json"), "w", encoding="utf-8") as f:
+        json.dump(schema, f, ensure_ascii=False, indent=2)
+    # 出来上がったディレクトリで置き換える（読み込み中の古い memmap はそのまま読める）
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+
+def default_out_dir(source: str) -> str:
+    # ./data/dummy.csv → ./data/training/dummy
+    name = os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+    return os.path.join(TRAINING_DIR, name)
+
+
+class TrainingData:
+    """
+    compile_training_data の出力を memmap で開いたもの。`ranges` は使う行の
+    [start, stop) の並び（None なら全行）で、split() で日付ごとに絞り込む。
+    """
+
+    def __init__(self, directory: str, ranges: np.ndarray | None = None):
+        self.directory = directory
+        with open(os.path.join(directory, "schema.json"), encoding="utf-8") as f:
+            self.schema = json.load(f)
+        self.features = np.load(os.path.join(directory, "features.npy"), mmap_mode="r")
+        self.target = np.load(os.path.join(directory, "target.npy"), mmap_mode="r")
+        self.dates = np.load(os.path.join(directory, "dates.npy"), mmap_mode="r")
+        if ranges is None:
+            ranges = np.array([[0, len(self.target)]], dtype=np.int64)
+        self.ranges = ranges
+
+    def __getstate__(self):
+        # 配列の中身ではなくパスを送り、受け取ったプロセスで memmap を開き直す
+        return {"directory": self.directory, "ranges": self.ranges}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"], state["ranges"])
+
+    def __len__(self) -> int:
+        return int((self.ranges[:, 1] - self.ranges[:, 0]).sum())
+
+    @property
+    def columns(self) -> list:
+        return self.schema["features"]
+
+    def column(self, name: str) -> int:
+        return self.columns.index(name)
+
+    def where(self, start: str | None = None, end: str | None = None) -> "TrainingData":
+        """start 以上 end 未満の日付の行だけを使う TrainingData（行はコピーしない）"""
+        keep = np.zeros(len(self.target), dtype=bool)
+        for lo, hi in self.ranges:
+            keep[lo:hi] = True
+        if start is not None:
+            keep &= self.dates >= np.datetime64(start, "D")
+        if end is not None:
+            keep &= self.dates < np.datetime64(end, "D")
+        # 連続する行を [start, stop) の区間にまとめる
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], keep.view(np.int8), [0]])))
+        # 同じ memmap を共有する（copy.copy は __getstate__ 経由で開き直してしまう）
+        subset = TrainingData.__new__(TrainingData)
+        subset.__dict__ = {**self.__dict__, "ranges": edges.reshape(-1, 2).astype(np.int64)}
+        return subset
+
+    def split(self, valid_from: str, valid_until: str | None = None) -> tuple:
+        """valid_from より前を学習用、valid_from 以降（valid_until 未満）を検証用に分ける"""
+        return self.where(end=valid_from), self.where(valid_from, valid_until)
+
+    def batches(self, batch_size: int = BATCH_SIZE, shuffle: bool = False,
+                seed: int | None = None, drop_last: bool = False):
+        """
+        (X, y) のミニバッチを返す。連続した batch_size 行を1バッチとし、
+        shuffle=True ではバッチの順番を並べ替える。区間の境目をまたぐバッチ
+        以外は memmap のビュー（コピーなし）なので、書き換えないこと。
+        """
+        offsets = np.concatenate([[0], np.cumsum(self.ranges[:, 1] - self.ranges[:, 0])])
+        n_batches = len(self) // batch_size if drop_last else -(-len(self) // batch_size)
+        order = np.arange(n_batches)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(order)
+        for k in order:
+            first, last = k * batch_size, min((k + 1) * batch_size, len(self))
+            pieces = []
+            i = np.searchsorted(offsets, first, side="right") - 1
+            while first < last:
+                lo = self.ranges[i, 0] + first - offsets[i]
+                hi = lo + min(last, offsets[i + 1]) - first
+                pieces.append(slice(lo, hi))
+                first += hi - lo
+                i += 1
+            if len(pieces) == 1:
+                yield self.features[pieces[0]], self.target[pieces[0]]
+            else:
+                yield (np.concatenate([self.features[p] for p in pieces]),
+                       np.concatenate([self.target[p] for p in pieces]))
+
+    def one_hot(self, X: np.ndarray, name: str) -> np.ndarray:
+        """バッチ X のカテゴリ列 name を one-hot（行 × カテゴリ数）にする"""
+        n_categories = len(self.schema["categories"][name])
+        return np.eye(n_categories, dtype=np.float32)[X[:, self.column(name)].astype(np.int64)]
+
+
+def load_training_data(source: str = DUMMY_FILE, out_dir: str | None = None) -> TrainingData:
+    """必要ならコンパイルして TrainingData を返す"""
+    return TrainingData(compile_training_data(source, out_dir))
+
+
+def print_summary(data: TrainingData) -> None:
+    size_mb = (data.features.nbytes + data.target.nbytes + data.dates.nbytes) / 2**20
+    print(f"✅ コンパイル完了: {len(data)} 行 × {len(data.columns)} 特徴量（{size_mb:.1f} MB）→ {data.directory}")
+    print(f"   期間: {data.dates[0]} 〜 {data.dates[-1]}")
+    for name, values in data.schema["categories"].items():
+        preview = ", ".join(values[:6]) + (" …" if len(values) > 6 else "")
+        print(f"   {name}: {len(values)} 種類（{preview}）")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="需要データを学習用の memmap 特徴量行列にコンパイルする")
+    parser.add_argument("--source", default=DUMMY_FILE,
+                        help=f"ダミーデータのファイルか src.stop_demand の出力ディレクトリ（既定: {DUMMY_FILE}）")
+    parser.add_argument("--out", help=f"出力ディレクトリ（既定: {TRAINING_DIR}/<入力名>）")
+    parser.add_argument("--force", action="store_true", help="入力が変わっていなくても作り直す")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print_summary(TrainingData(compile_training_data(args.source, args.out, args.force)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,58 @@
+import os
+
+import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer
+
+from src.embedding_cache import EmbeddingCache
+from src.encoders import MODEL_NAME, make_encoder
+from src.metrics import metrics
 
 """ config """
-MODEL_NAME = "intfloat/multilingual-e5-small"
-model = SentenceTransformer(MODEL_NAME)
+# Encoder backend: "sentence-transformers" (MODEL_NAME) or the offline "hashing" stand-in
+ENCODER = os.environ.get("MOCA_ENCODER", "sentence-transformers")
+# Number of texts passed to the model in one encode call
+ENCODE_BATCH_SIZE = 64
+# Embeddings already computed for a (model, text) pair, kept across runs
+embedding_cache = EmbeddingCache()
+
+_encoder = None
+
+
+def get_encoder():
+    # Built on first use, so importing this module never loads the model
+    global _encoder
+    if _encoder is None:
+        _encoder = make_encoder(ENCODER)
+    return _encoder
+
+
+def set_encoder(encoder):
+    """Replace the encoder, e.g. with encoders.HashingEncoder() in tests."""
+    global _encoder
+    _encoder = encoder
 
 
 def generate_vector(text):
-    return model.encode(text)
+    return generate_vectors([text])[0]
+
+
+def generate_vectors(texts, batch_size=ENCODE_BATCH_SIZE):
+    """
+    Encode many texts at once. Duplicates are encoded only once, cached
+    vectors are reused, and the rest go to the encoder in batches of
+    `batch_size`. Returns a float32 array with one row per input text.
+    """
+    encoder = get_encoder()
+    unique_texts = list(dict.fromkeys(texts))
+    if not unique_texts:
+        return np.empty((0, encoder.dimension), dtype=np.float32)
+    vectors = dict(zip(unique_texts, embedding_cache.get_many(encoder.name, unique_texts)))
+    missing = [text for text in unique_texts if vectors[text] is None]
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start : start + batch_size]
+        with metrics.stage("encode"):
+            encoded = encoder.encode(batch, batch_size=batch_size)
+        metrics.count("texts_encoded", len(batch))
+        # The stored form, so a rerun that reads the cache gets the same vectors
+        vectors.update(zip(batch, embedding_cache.put_many(encoder.name, batch, encoded)))
+    return np.stack([vectors[text] for text in texts]).astype(np.float32, copy=False)